@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of kitpy.config
+
+Compares load and dump throughput of ``YamlHandler`` on a multi-MB file,
+against building a new ``YAML`` instance per call.
+
+Usage:
+    python -m benchmarks.bench_config
+
+"""
+import os
+import tempfile
+import timeit
+
+from ruamel.yaml import YAML
+
+from kitpy import config
+
+NUMBER = 1
+
+
+def make_data(size: int = 20000) -> dict:
+    return {
+        f'item_{i}': {
+            'id': i,
+            'name': f'name {i}',
+            'enable': i % 2 == 0,
+            'ratio': i / 7,
+            'tags': ['a', 'b', 'c'],
+        } for i in range(size)
+    }
+
+
+def bench(name: str, func, size: int) -> None:
+    cost = timeit.timeit(func, number=NUMBER) / NUMBER
+    print(f'{name:<28}: {cost * 1e3:8.1f} ms  '
+          f'{size / cost / 2 ** 20:6.2f} MB/s')
+
+
+def main() -> None:
+    data = make_data()
+    with tempfile.TemporaryDirectory() as root:
+        filename = os.path.join(root, 'bench.yml')
+        handler = config.YamlHandler(filename)
+        handler.dump(data)
+        size = os.path.getsize(filename)
+        print(f'file size: {size / 2 ** 20:.2f} MB, '
+              f'ruamel C parser: {config.YamlHandler.C_PARSER}')
+
+        def load_new_instance():
+            with open(filename, 'r', encoding='utf-8') as f:
+                YAML(typ='safe').load(f)
+
+        def dump_new_instance():
+            with open(filename, 'w', encoding='utf-8') as f:
+                YAML().dump(data, f)
+
+        def load_pyyaml():
+            config.YamlHandler.LOADER = 'pyyaml'
+            try:
+                handler.load()
+            finally:
+                config.YamlHandler.LOADER = 'ruamel'
+
+        bench('load, new YAML per call', load_new_instance, size)
+        bench('load, YamlHandler', handler.load, size)
+        bench('load, YamlHandler (pyyaml)', load_pyyaml, size)
+        bench('dump, new YAML per call', dump_new_instance, size)
+        bench('dump, YamlHandler', lambda: handler.dump(data), size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of kitpy.convert
+
+Compares ``dict2ad`` against ``dict2ad(lazy=True)`` on a deep document of
+100k nodes, converting it and reading one leaf, and records of
+``dict2record`` against ``dict``/``AdvancedDict`` rows, and filtering rows
+against filtering the columns of ``to_columns``, and deep path lookups.
+
+Usage:
+    python -m benchmarks.bench_convert
+
+"""
+import sys
+import timeit
+
+from kitpy import convert
+
+NUMBER = 10
+
+
+def make_data(depth: int = 5, width: int = 10) -> dict:
+    if depth == 0:
+        return {'value': 1, 'tags': ['a', 'b']}
+    return {f'node_{i}': make_data(depth - 1, width) for i in range(width)}
+
+
+def main() -> None:
+    data = make_data()
+    results = {
+        'dict2ad': lambda: convert.dict2ad(data).node_1.node_2.node_3,
+        'dict2ad(lazy=True)':
+            lambda: convert.dict2ad(data, lazy=True).node_1.node_2.node_3,
+    }
+    for name, func in results.items():
+        cost = timeit.timeit(func, number=NUMBER) / NUMBER
+        print(f'{name:<20}: {cost * 1e3:10.3f} ms')
+
+    rows = [{'id': i, 'name': f'name {i}', 'score': i / 3, 'enable': True}
+            for i in range(100000)]
+    results = {
+        'dict': rows,
+        'AdvancedDict': convert.dict2ad(rows),
+        'dict2record': convert.dict2record(rows),
+    }
+    for name, items in results.items():
+        size = sum(map(sys.getsizeof, items)) / len(items)
+        if type(items[0]) is dict:
+            func = lambda: [item['score'] for item in items]
+        else:
+            func = lambda: [item.score for item in items]
+        cost = timeit.timeit(func, number=NUMBER) / NUMBER
+        print(f'{name:<20}: {size:6.0f} bytes/row  '
+              f'{cost * 1e3:8.3f} ms per 100k reads')
+
+    columns = convert.to_columns(rows)
+    results = {
+        'filter rows': lambda: [row for row in rows if row['id'] >= 50000],
+        'filter columns': lambda: convert.filter_rows(
+            columns, convert.where(columns, 'id', '>=', 50000)),
+    }
+    for name, func in results.items():
+        cost = timeit.timeit(func, number=NUMBER) / NUMBER
+        print(f'{name:<20}: {cost * 1e3:10.3f} ms')
+    bench_path()
+
+
+def bench_path() -> None:
+    cfg = convert.dict2ad({'file': {'path': {'name': 'kitpy.log'}}})
+    get_name = cfg.compile_path('file.path.name')
+    results = {
+        'attribute': lambda: cfg.file.path.name,
+        'get_path': lambda: cfg.get_path('file.path.name'),
+        'compile_path': lambda: get_name(cfg),
+    }
+    for name, func in results.items():
+        cost = timeit.timeit(func, number=100000) / 100000
+        print(f'{name:<20}: {cost * 1e9:10.1f} ns')
+
+
+if __name__ == '__main__':
+    main()
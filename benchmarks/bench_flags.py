@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of kitpy.flags
+
+Compares reading a flag by attribute, by ``get`` and from a ``snapshot``,
+and the cost of a write.
+
+Usage:
+    python -m benchmarks.bench_flags
+
+"""
+import timeit
+
+from kitpy.flags import FLAGS
+
+NUMBER = 1000000
+
+
+def main() -> None:
+    FLAGS.define('bench.enable', True)
+    snapshot = FLAGS.snapshot()
+    results = {
+        'attribute': lambda: getattr(FLAGS, 'bench.enable'),
+        'get': lambda: FLAGS.get('bench.enable'),
+        'snapshot': lambda: snapshot['bench.enable'],
+        'set': lambda: FLAGS.set('bench.enable', 'false'),
+    }
+    for name, func in results.items():
+        cost = timeit.timeit(func, number=NUMBER) / NUMBER
+        print(f'{name:<10}: {cost * 1e9:8.1f} ns')
+    FLAGS.delete('bench.enable')
+
+
+if __name__ == '__main__':
+    main()
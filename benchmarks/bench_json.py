@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of kitpy.jsonz
+
+Compares the installed JSON backends on a typical payload, through
+``jsonz`` and through ``serialize.encode``/``decode`` of ``Serializable``
+objects, with and without ``refs`` on shared objects, and serial against
+parallel ``encode_many``.
+
+Usage:
+    python -m benchmarks.bench_json
+
+"""
+import timeit
+
+from kitpy import jsonz
+from kitpy.experimental import serialize
+
+NUMBER = 20
+
+
+class People(serialize.Serializable):
+    def __init__(self, name: str, age: int, tags: list) -> None:
+        self.name = name
+        self.age = age
+        self.tags = tags
+
+    def __encode__(self) -> dict:
+        return {'name': self.name, 'age': self.age, 'tags': self.tags}
+
+    @classmethod
+    def __decode__(cls, obj: dict) -> 'People':
+        return cls(**obj)
+
+
+def main() -> None:
+    data = [{'id': i, 'name': f'name {i}', 'score': i / 3,
+             'enable': i % 2 == 0, 'tags': ['a', 'b', 'c']}
+            for i in range(10000)]
+    peoples = [People(f'name {i}', i, ['a', 'b']) for i in range(10000)]
+    previous = jsonz.backend()
+    for name in jsonz.available():
+        jsonz.use(name)
+        text = jsonz.dumps(data, separators=jsonz.COMPACT)
+        encoded = serialize.encode(peoples, separators=jsonz.COMPACT,
+                                   ensure_ascii=False)
+        results = {
+            'dumps': lambda: jsonz.dumps(data, separators=jsonz.COMPACT),
+            'loads': lambda: jsonz.loads(text),
+            'encode': lambda: serialize.encode(peoples,
+                                               separators=jsonz.COMPACT,
+                                               ensure_ascii=False),
+            'decode': lambda: serialize.decode(encoded, People),
+        }
+        costs = '  '.join(
+            f'{key}: {timeit.timeit(func, number=NUMBER) / NUMBER * 1e3:6.2f} ms'
+            for key, func in results.items()
+        )
+        print(f'{name:<10} {costs}')
+    jsonz.use(previous.name)
+
+    owners = [People(f'owner {i}', i, ['x'] * 20) for i in range(100)]
+    shared = [{'id': i, 'owner': owners[i % 100]} for i in range(10000)]
+    for refs in (False, True):
+        encoded = serialize.encode(shared, refs=refs)
+        cost = timeit.timeit(lambda: serialize.encode(shared, refs=refs),
+                             number=NUMBER) / NUMBER * 1e3
+        print(f'refs={refs!s:<5}  encode: {cost:6.2f} ms  '
+              f'size: {len(encoded) / 1024:8.1f} KiB')
+
+    many = [People(f'name {i}', i, ['a', 'b'] * 10) for i in range(100000)]
+    for workers in (1, None):
+        start = timeit.default_timer()
+        serialize.encode_many(many, workers=workers)
+        cost = (timeit.default_timer() - start) * 1e3
+        print(f'encode_many workers={workers!s:<4}  {cost:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of kitpy.log handlers
+
+Measures the per-record ``emit`` cost of ``TimedRotatingFileHandler`` with
+and without month archiving.
+
+Usage:
+    python -m benchmarks.bench_log
+
+"""
+import logging
+import tempfile
+import timeit
+
+from kitpy import path
+from kitpy.log import TimedRotatingFileHandler
+
+NUMBER = 20000
+
+
+def bench_emit(month_archiving: bool) -> float:
+    with tempfile.TemporaryDirectory() as root:
+        handler = TimedRotatingFileHandler(
+            path.join(root, 'bench'),
+            when='D',
+            encoding='utf-8',
+            month_archiving=month_archiving
+        )
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        record = logging.LogRecord('bench', logging.INFO, __file__, 0,
+                                   'benchmark message %d', (1,), None)
+        cost = timeit.timeit(lambda: handler.emit(record), number=NUMBER)
+        handler.close()
+    return cost / NUMBER * 1e6
+
+
+def main() -> None:
+    for month_archiving in (False, True):
+        cost = bench_emit(month_archiving)
+        print(f'emit month_archiving={month_archiving!s:<5}: '
+              f'{cost:.2f} us/record')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of kitpy.timez
+
+Compares the cached ``timez.now`` with formatting the current time through
+``time.strftime`` on every call.
+
+Usage:
+    python -m benchmarks.bench_timez
+
+"""
+import time
+import timeit
+
+from kitpy import timez
+
+NUMBER = 200000
+
+
+def uncached(fmt: str) -> str:
+    return time.strftime(fmt, time.localtime(time.time()))
+
+
+def main() -> None:
+    for fmt in (timez.TimeFormat.SHORT, timez.TimeFormat.LONG):
+        base = timeit.timeit(lambda: uncached(fmt), number=NUMBER)
+        cached = timeit.timeit(lambda: timez.now(fmt), number=NUMBER)
+        print(f'{fmt!r:<22} time.strftime: {base / NUMBER * 1e9:7.0f} ns  '
+              f'timez.now: {cached / NUMBER * 1e9:7.0f} ns  '
+              f'({base / cached:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@
 from kitpy import config
 from kitpy import convert
 from kitpy import flags
+from kitpy import jsonz
 from kitpy import log
 from kitpy import path
 from kitpy import project
@@ -17,6 +18,8 @@ __version__ = '0.2.5'
 
 ConfigHandler = config.ConfigHandler
 JsonHandler = config.JsonHandler
+JsonLinesHandler = config.JsonLinesHandler
+LayeredConfig = config.LayeredConfig
 YamlHandler = config.YamlHandler
 
 AdvancedDict = convert.AdvancedDict
@@ -1,12 +1,38 @@
 # -*- coding: utf-8 -*-
 import abc
+import copy
+import hashlib
+import io
+import logging
+import math
 import os
 import json
+import re
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Iterable, Iterator, Mapping
 
+import yaml
 from ruamel.yaml import YAML
 
+from kitpy import jsonz
+from kitpy import sio
+from kitpy.convert import merge
+from kitpy.convert import set_path
+from kitpy.dev.thread import AdvancedThread
+from kitpy.flags import FLAGS
+from kitpy.log import COLLECTOR_ENV
+from kitpy.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
 
 class Handler(abc.ABC):
+    # Whether ``ConfigCache`` keeps the parsed objects, which pays off only
+    # when parsing costs more than the deep copy of the cached object.
+    CACHE = False
+
     @abc.abstractmethod
     def load(self) -> dict: ...
 
@@ -18,10 +44,12 @@ class BaseHander(Handler):
     def __init__(self,
                  filename: str,
                  encoding='utf-8',
-                 readonly=False):
+                 readonly=False,
+                 fsync=False):
         self.filename = filename
         self.encoding = encoding
         self.readonly = readonly
+        self.fsync = fsync
 
     def load(self) -> dict:
         if not self.exists:
@@ -40,51 +68,228 @@ class BaseHander(Handler):
         if self.readonly:
             raise Exception('readonly')
 
+    def write(self, content: str, encoding: str = None) -> None:
+        """
+        Replace the file with ``content`` atomically, while holding the
+        advisory lock of the file, see ``sio.write_atomic`` and ``sio.lock``.
+        """
+        with sio.lock(self.filename):
+            sio.write_atomic(self.filename,
+                             content,
+                             encoding=encoding or self.encoding,
+                             fsync=self.fsync)
+
     @property
     def exists(self) -> bool:
         return os.path.exists(self.filename)
 
 
 class JsonHandler(BaseHander):
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+    NUMBER_CHARS = frozenset('0123456789.eE+-')
+
     def load(self) -> dict:
         super().load()
         with open(self.filename, 'r', encoding=self.encoding) as f:
-            result = json.load(f)
+            result = jsonz.loads(f.read())
         return result
 
+    def iter_load(self, chunk_size=65536) -> Iterator[Any]:
+        """
+        Yield the items of a top-level JSON array one by one, reading the
+        file in chunks of ``chunk_size`` characters, so memory is bounded
+        by the largest item. Any other document is yielded as a whole.
+        """
+        super().load()
+        decoder = json.JSONDecoder()
+        with open(self.filename, 'r', encoding=self.encoding) as f:
+            buffer, pos = '', 0
+
+            def more() -> bool:
+                nonlocal buffer
+                chunk = f.read(chunk_size)
+                buffer += chunk
+                return bool(chunk)
+
+            def skip() -> str:
+                nonlocal pos
+                while True:
+                    pos = self.WHITESPACE.match(buffer, pos).end()
+                    if pos < len(buffer):
+                        return buffer[pos]
+                    if not more():
+                        return ''
+
+            if skip() != '[':
+                yield json.loads(buffer[pos:] + f.read())
+                return
+            pos += 1
+            if skip() == ']':
+                return
+            while True:
+                skip()
+                while True:
+                    try:
+                        obj, end = decoder.raw_decode(buffer, pos)
+                    except json.JSONDecodeError:
+                        if not more():
+                            raise
+                        continue
+                    # A number may continue in the next chunk.
+                    if end < len(buffer) and \
+                            buffer[end] not in self.NUMBER_CHARS:
+                        break
+                    if not more():
+                        break
+                yield obj
+                buffer, pos = buffer[end:], 0
+                char = skip()
+                if char == ',':
+                    pos += 1
+                elif char == ']':
+                    return
+                else:
+                    raise json.JSONDecodeError("Expecting ',' delimiter",
+                                               buffer, pos)
+
     def dump(self, obj: dict, indent=2, ensure_ascii=False) -> None:
         super().dump(obj)
-        with open(self.filename, 'w', encoding=self.encoding) as f:
-            json.dump(
-                obj,
-                f,
-                indent=indent,
-                ensure_ascii=ensure_ascii
-            )
+        self.write(jsonz.dumps(
+            obj,
+            indent=indent,
+            ensure_ascii=ensure_ascii
+        ))
+
+
+class JsonLinesHandler(BaseHander):
+    """Handler of JSON Lines files, one JSON document per line"""
+    def load(self) -> list:
+        return list(self.iter_load())
+
+    def iter_load(self) -> Iterator[Any]:
+        """Yield the records one by one, with bounded memory."""
+        super().load()
+        with open(self.filename, 'r', encoding=self.encoding) as f:
+            for line in f:
+                if line.strip():
+                    yield jsonz.loads(line)
+
+    def dump(self, obj: Iterable[Any], ensure_ascii=False) -> None:
+        """Replace the file with the records of ``obj`` atomically."""
+        if self.readonly:
+            raise Exception('readonly')
+        with sio.lock(self.filename):
+            with sio.open_atomic(self.filename,
+                                 encoding=self.encoding,
+                                 fsync=self.fsync) as f:
+                for line in self._iter_lines(obj, ensure_ascii):
+                    f.write(line)
+
+    def append(self, obj: Iterable[Any], batch_size=1000,
+               ensure_ascii=False) -> None:
+        """Append the records of ``obj``, writing ``batch_size`` at once."""
+        if self.readonly:
+            raise Exception('readonly')
+        batch = []
+        with sio.lock(self.filename):
+            with open(self.filename, 'a', encoding=self.encoding) as f:
+                for line in self._iter_lines(obj, ensure_ascii):
+                    batch.append(line)
+                    if len(batch) >= batch_size:
+                        f.write(''.join(batch))
+                        batch.clear()
+                f.write(''.join(batch))
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    @staticmethod
+    def _iter_lines(obj: Iterable[Any], ensure_ascii: bool) -> Iterator[str]:
+        for record in obj:
+            yield jsonz.dumps(record,
+                              separators=jsonz.COMPACT,
+                              ensure_ascii=ensure_ascii) + '\n'
 
 
 class YamlHandler(BaseHander):
+    """Handler of YAML files
+
+    ``YAML`` instances are reused per thread, since they are not
+    thread-safe. The ``'ruamel'`` loader uses the libyaml parser of
+    ``ruamel.yaml.clib`` when it is installed, see ``C_PARSER``.
+
+    Set ``LOADER`` to ``'pyyaml'`` to load with PyYAML's ``CSafeLoader``
+    instead, which is faster but resolves scalars by YAML 1.1 rules, e.g.
+    ``yes`` and ``no`` are loaded as booleans.
+    """
+    CACHE = True
+    LOADER = 'ruamel'
+    C_PARSER = YAML(typ='safe').Parser.__name__ == 'CParser'
+    PYYAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    _local = threading.local()
+
+    @classmethod
+    def yaml(cls, typ: str = 'rt') -> YAML:
+        """Return the ``YAML`` instance of ``typ`` for the current thread."""
+        instances = getattr(cls._local, 'instances', None)
+        if instances is None:
+            instances = cls._local.instances = dict()
+        instance = instances.get(typ)
+        if instance is None:
+            instance = instances[typ] = YAML(typ=typ)
+        return instance
+
     def load(self) -> dict:
         super().load()
         with open(self.filename, 'r', encoding='utf-8') as f:
-            result = YAML(typ='safe').load(f)
+            if self.LOADER == 'pyyaml':
+                result = yaml.load(f, Loader=self.PYYAML_LOADER)
+            else:
+                result = self.yaml('safe').load(f)
         if result is None:
             result = dict()
         return result
 
     def dump(self, obj: dict) -> None:
         super().dump(obj)
-        with open(self.filename, 'w', encoding='utf-8') as f:
-            YAML().dump(obj, f)
+        stream = io.StringIO()
+        self.yaml().dump(obj, stream)
+        self.write(stream.getvalue(), encoding='utf-8')
 
 
 class ConfigHandler(BaseHander):
+    """Handler of config files, chosen by the file extension
+
+    With ``snapshot``, the parsed object is also stored as compact JSON next
+    to the file, e.g. ``.config.yml.cache`` for ``config.yml``, and loaded
+    from there while the file is unchanged. The snapshot is validated by
+    the ``mtime_ns`` and size of the file, and by its content hash when
+    only the metadata changed.
+
+    Objects which JSON can not represent, e.g. dates or integer keys, are
+    not stored. On POSIX, a snapshot is ignored unless it is owned by the
+    current user or the owner of the file, and only writable by its owner.
+    """
+    SNAPSHOT_VERSION = 2
+
     def __init__(self,
                  filename: str,
                  encoding='utf-8',
-                 readonly=False):
-        super().__init__(filename, encoding, readonly)
-        self._handler = self.create_handler()(filename, encoding, readonly)
+                 readonly=False,
+                 fsync=False,
+                 snapshot=False):
+        super().__init__(filename, encoding, readonly, fsync)
+        self.snapshot = snapshot
+        self._handler = self.create_handler()(filename,
+                                              encoding,
+                                              readonly,
+                                              fsync)
+        self.CACHE = self._handler.CACHE
+
+    @property
+    def snapshot_filename(self) -> str:
+        dir_name, base_name = os.path.split(self.filename)
+        return os.path.join(dir_name, f'.{base_name}.cache')
 
     def create_handler(self) -> 'Handler':
         if self.filename.endswith('.yml'):
@@ -93,18 +298,360 @@ class ConfigHandler(BaseHander):
             return YamlHandler
         if self.filename.endswith('.json'):
             return JsonHandler
+        if self.filename.endswith(('.jsonl', '.ndjson')):
+            return JsonLinesHandler
         return BaseHander
 
     def load(self) -> dict:
-        return self._handler.load()
+        if not self.snapshot:
+            return self._handler.load()
+
+        key = _stat_key(self.filename)
+        if key is None:
+            return self._handler.load()
+        digest = None
+        header = self._load_snapshot_header()
+        if header is not None:
+            if header['key'] == key:
+                result = self._load_snapshot_data()
+                if result is not None:
+                    return result[0]
+            digest = self._digest()
+            if header['digest'] == digest:
+                result = self._load_snapshot_data()
+                if result is not None:
+                    self._dump_snapshot(key, digest, result[0])
+                    return result[0]
+
+        digest = digest or self._digest()
+        result = self._handler.load()
+        if _stat_key(self.filename) == key:
+            self._dump_snapshot(key, digest, result)
+        return result
 
     def dump(self, obj: dict, *args, **kwargs) -> None:
         self._handler.dump(obj, *args, **kwargs)
 
+    def iter_load(self, *args, **kwargs) -> Iterator[Any]:
+        return self._handler.iter_load(*args, **kwargs)
+
+    def append(self, obj: Iterable[Any], *args, **kwargs) -> None:
+        self._handler.append(obj, *args, **kwargs)
+
+    def _digest(self) -> str:
+        with open(self.filename, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def _open_snapshot(self):
+        f = open(self.snapshot_filename, 'rb')
+        if hasattr(os, 'getuid'):
+            stat = os.fstat(f.fileno())
+            owners = (os.getuid(), os.stat(self.filename).st_uid)
+            if stat.st_uid not in owners or stat.st_mode & 0o022:
+                f.close()
+                raise PermissionError('untrusted snapshot',
+                                      self.snapshot_filename)
+        return f
+
+    def _load_snapshot_header(self):
+        try:
+            with self._open_snapshot() as f:
+                header = jsonz.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+        if (not isinstance(header, dict)
+                or header.get('version') != self.SNAPSHOT_VERSION):
+            return None
+        header['key'] = tuple(header.get('key') or ())
+        return header
+
+    def _load_snapshot_data(self):
+        try:
+            with self._open_snapshot() as f:
+                f.readline()
+                return (jsonz.loads(f.readline()),)
+        except (OSError, ValueError):
+            return None
+
+    def _dump_snapshot(self, key: tuple, digest: str, obj: dict) -> None:
+        if not _is_json(obj):
+            return
+        header = {
+            'version': self.SNAPSHOT_VERSION,
+            'key': key,
+            'digest': digest,
+        }
+        content = jsonz.dumps(header, separators=jsonz.COMPACT) + '\n' \
+            + jsonz.dumps(obj, separators=jsonz.COMPACT) + '\n'
+        try:
+            sio.write_atomic(self.snapshot_filename, content)
+            os.chmod(self.snapshot_filename, 0o644)
+        except OSError:
+            logger.debug(f'cannot write snapshot {self.snapshot_filename}')
+
+
+def _is_json(obj: Any) -> bool:
+    """Whether ``obj`` is loaded back from JSON as it is."""
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, dict):
+            if not all(isinstance(key, str) for key in obj):
+                return False
+            stack.extend(obj.values())
+        elif isinstance(obj, list):
+            stack.extend(obj)
+        elif isinstance(obj, float):
+            if not math.isfinite(obj):
+                return False
+        elif obj is not None and not isinstance(obj, (str, int)):
+            return False
+    return True
+
 
-def load(filename: str) -> dict:
-    return ConfigHandler(filename).load()
+def _stat_key(filename: str):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ConfigCache(Singleton):
+    """Process-wide cache of parsed config files
+
+    Entries are keyed by the real path of the file and validated by its
+    ``mtime_ns`` and size, so an unchanged file is never parsed twice.
+    Only the files of handlers with ``CACHE``, i.e. YAML, are cached, the
+    others parse faster than a deep copy. At most ``MAX_ENTRIES`` files
+    are kept, the least recently loaded are evicted first.
+
+    This is a Singleton Class
+    """
+    MAX_ENTRIES = 128
+
+    def __init__(self):
+        self._entries = dict()
+
+    def load(self, filename: str, snapshot=False) -> dict:
+        """
+        Load a config file through the cache.
+
+        Args:
+            filename (str): the config file
+            snapshot (bool): parse through the snapshot of the file, see
+                ``ConfigHandler``
+
+        Returns:
+            dict: a deep copy of the cached object, which the caller may
+                modify freely
+        """
+        handler = ConfigHandler(filename, snapshot=snapshot)
+        if not handler.CACHE:
+            return handler.load()
+        path = os.path.realpath(filename)
+        key = _stat_key(path)
+        with self._lock:
+            entry = self._entries.pop(path, None)
+        if key is None or entry is None or entry[0] != key:
+            entry = (key, handler.load())
+        with self._lock:
+            self._entries[path] = entry
+            while len(self._entries) > self.MAX_ENTRIES:
+                del self._entries[next(iter(self._entries))]
+        return copy.deepcopy(entry[1])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class ConfigWatcher(AdvancedThread):
+    """Thread which reloads changed config files
+
+    Polls the watched files every ``interval`` seconds, and calls the
+    subscribers of a changed file with the reloaded object.
+    """
+    def __init__(self, interval: float = 1.):
+        self.interval = interval
+        self._subscribers = dict()
+        self._keys = dict()
+        self._lock = threading.Lock()
+        super().__init__()
+
+    def subscribe(self, filename: str, callback: Callable[[dict], None]) -> None:
+        path = os.path.realpath(filename)
+        with self._lock:
+            if path not in self._subscribers:
+                self._subscribers[path] = []
+                self._keys[path] = _stat_key(path)
+            self._subscribers[path].append(callback)
+
+    def unsubscribe(self, filename: str, callback: Callable[[dict], None]) -> None:
+        path = os.path.realpath(filename)
+        with self._lock:
+            callbacks = self._subscribers.get(path, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(path, None)
+                self._keys.pop(path, None)
+
+    def check(self) -> None:
+        """Check the watched files once and notify the subscribers."""
+        with self._lock:
+            subscribers = [(path, list(callbacks))
+                           for path, callbacks in self._subscribers.items()]
+        for path, callbacks in subscribers:
+            key = _stat_key(path)
+            if key is None or key == self._keys.get(path):
+                continue
+            self._keys[path] = key
+            for callback in callbacks:
+                try:
+                    callback(ConfigCache().load(path))
+                except Exception:
+                    logger.exception(f'failed to reload {path}')
+
+    def call(self) -> None:
+        self.check()
+        time.sleep(self.interval)
+
+
+_watcher: ConfigWatcher = None
+_watcher_lock = threading.Lock()
+
+
+def watch(filename: str,
+          callback: Callable[[dict], None],
+          interval: float = 1.) -> ConfigWatcher:
+    """
+    Call ``callback`` with the reloaded object whenever the config file
+    changes. All files share one watcher thread, which is started on the
+    first call with the given ``interval``.
+
+    Returns:
+        ConfigWatcher: the watcher
+    """
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = ConfigWatcher(interval)
+            _watcher.start()
+    _watcher.subscribe(filename, callback)
+    return _watcher
+
+
+def unwatch(filename: str, callback: Callable[[dict], None]) -> None:
+    if _watcher is not None:
+        _watcher.unsubscribe(filename, callback)
+
+
+def load(filename: str, cache=True, snapshot=False) -> dict:
+    if cache:
+        return ConfigCache().load(filename, snapshot=snapshot)
+    return ConfigHandler(filename, snapshot=snapshot).load()
 
 
 def dump(filename: str, obj: dict, *args, **kwargs) -> None:
     return ConfigHandler(filename).dump(obj, *args, **kwargs)
+
+
+def _freeze(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in obj.items()})
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(v) for v in obj)
+    return obj
+
+
+def _thaw(obj: Any) -> Any:
+    if isinstance(obj, Mapping):
+        return {k: _thaw(v) for k, v in obj.items()}
+    if isinstance(obj, tuple):
+        return [_thaw(v) for v in obj]
+    return obj
+
+
+def _parse_env(value: str) -> Any:
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class LayeredConfig:
+    """Layered config which is resolved once
+
+    Merges, from the lowest to the highest priority, ``defaults``, the
+    config ``files``, the environment variables starting with
+    ``env_prefix`` and ``FLAGS`` into a read-only lookup table, where every
+    dotted key, e.g. ``'logging.file.path'``, is a single dict lookup.
+    Nested values are read-only mappings and tuples.
+
+    Environment variables separate the levels with ``__``, e.g.
+    ``KITPY_LOGGING__LEVEL=debug`` sets ``logging.level``, and their values
+    are parsed as JSON when possible. Flags are applied with their names as
+    dotted keys, e.g. ``FLAGS.set('logging.level', 'debug')``. The
+    variables of kitpy itself in ``INTERNAL_ENV`` are skipped.
+
+    Call ``reload`` to resolve the layers again.
+    """
+    INTERNAL_ENV = frozenset({COLLECTOR_ENV})
+
+    def __init__(self,
+                 *files: str,
+                 defaults: dict = None,
+                 env_prefix: str = 'KITPY_',
+                 flags: bool = True):
+        self.files = files
+        self.defaults = defaults or dict()
+        self.env_prefix = env_prefix
+        self.flags = flags
+        self._table: Mapping[str, Any] = MappingProxyType(dict())
+        self._tree: Mapping[str, Any] = MappingProxyType(dict())
+        self.reload()
+
+    def reload(self) -> None:
+        merged = merge(dict(), copy.deepcopy(self.defaults))
+        for filename in self.files:
+            merge(merged, load(filename))
+        if self.env_prefix:
+            size = len(self.env_prefix)
+            for name, value in os.environ.items():
+                if name.startswith(self.env_prefix) and len(name) > size \
+                        and name not in self.INTERNAL_ENV:
+                    path = name[size:].lower().replace('__', '.')
+                    set_path(merged, path, _parse_env(value))
+        if self.flags:
+            for name, value in FLAGS.snapshot().items():
+                set_path(merged, name, value)
+
+        tree = _freeze(merged)
+        table = dict()
+        stack = [('', tree)]
+        while stack:
+            prefix, node = stack.pop()
+            for key, value in node.items():
+                path = f'{prefix}{key}'
+                table[path] = value
+                if isinstance(value, Mapping):
+                    stack.append((f'{path}.', value))
+        self._tree = tree
+        self._table = MappingProxyType(table)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._table.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self._table[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._table
+
+    def keys(self):
+        return self._table.keys()
+
+    def as_dict(self) -> dict:
+        """Return the merged config as a new nested ``dict``."""
+        return _thaw(self._tree)
@@ -1,5 +1,19 @@
 # -*- coding: utf-8 -*-
-from typing import Optional
+import functools
+import itertools
+import operator
+from array import array
+from collections import namedtuple
+from collections.abc import MutableMapping, MutableSequence
+from typing import (Any, Callable, Dict, Iterable, List, Optional, Sequence,
+                    Union)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Path = Union[str, Sequence[str]]
 
 
 class AdvancedDict(dict):
@@ -7,6 +21,8 @@ class AdvancedDict(dict):
     The superset of ``dict``.
     You can access the key values of a dict just like the members of class
     """
+    __slots__ = ()
+
     def __getattr__(self, key):
         return self.get(key)
 
@@ -17,16 +33,27 @@ class AdvancedDict(dict):
         return f"ADict({', '.join([f'{k}={v}' for k, v in self.items()])})"
 
     @classmethod
-    def from_dict(cls, _dict: dict) -> Optional['AdvancedDict']:
+    def from_dict(cls, _dict: dict, lazy=False) -> Optional['AdvancedDict']:
         """
         Return AdvancedDict from a ``dict``.
 
+        With ``lazy=True``, return an ``AdvancedDictView`` of ``_dict``
+        instead, which shares the memory of ``_dict`` and converts the
+        children on first access, so the conversion is O(1). The view is a
+        ``MutableMapping`` but not a ``dict``, so ``json.dumps`` and the
+        ``isinstance(x, dict)`` checks of kitpy (``Log.set_cfg``, ``merge``,
+        ``set_path``, ``config.dump``) reject it, pass ``view.to_dict()``
+        to them instead.
+
         Args:
             _dict (dict): the origin dict
+            lazy (bool): whether to return a view
 
         Returns:
             AdvancedDict: the advanced dict
         """
+        if lazy:
+            return _view(_dict)
         if isinstance(_dict, dict):
             obj = cls()
             for k, v in _dict.items():
@@ -36,5 +63,510 @@ class AdvancedDict(dict):
             return list(map(cls.from_dict, _dict))
         return _dict
 
+    @staticmethod
+    def compile_path(path: Path, default: Any = None) -> Callable:
+        """Return the getter of the dotted ``path``, see ``compile_path``."""
+        return compile_path(path, default)
+
+    def get_path(self, path: Path, default: Any = None) -> Any:
+        """Return the value at the dotted ``path``, or ``default``."""
+        return get_path(self, path, default)
+
+    def set_path(self, path: Path, value: Any) -> None:
+        """Set the value at the dotted ``path``, creating the parents."""
+        set_path(self, path, value, self.__class__)
+
+    def merge(self, other: dict) -> 'AdvancedDict':
+        """Deep update with ``other``, converted by ``from_dict``."""
+        return merge(self, self.from_dict(other))
+
+
+@functools.lru_cache(maxsize=1024)
+def _path_getter(path: Path) -> Callable:
+    keys = tuple(path.split('.')) if isinstance(path, str) else path
+    if len(keys) == 1:
+        key0, = keys
+        return lambda obj: obj[key0]
+    if len(keys) == 2:
+        key0, key1 = keys
+        return lambda obj: obj[key0][key1]
+    if len(keys) == 3:
+        key0, key1, key2 = keys
+        return lambda obj: obj[key0][key1][key2]
+
+    def getter(obj):
+        for key in keys:
+            obj = obj[key]
+        return obj
+
+    return getter
+
+
+def compile_path(path: Path, default: Any = None) -> Callable[[dict], Any]:
+    """
+    Return the getter of the dotted ``path``, which returns ``default`` if
+    the path is missing.
+
+    Examples:
+        >>> get_level = compile_path('console.level', 'INFO')
+        >>> get_level({'console': {'level': 'DEBUG'}})
+        'DEBUG'
+
+    Args:
+        path (Union[str, Sequence[str]]): the dotted path, or the keys
+        default (Any): the value of a missing path
+    """
+    if isinstance(path, list):
+        path = tuple(path)
+    getter = _path_getter(path)
+
+    def get(obj: dict) -> Any:
+        try:
+            return getter(obj)
+        except (KeyError, IndexError, TypeError):
+            return default
+
+    return get
+
+
+def get_path(obj: dict, path: Path, default: Any = None) -> Any:
+    """Return the value at the dotted ``path`` of ``obj``, or ``default``."""
+    if isinstance(path, list):
+        path = tuple(path)
+    try:
+        return _path_getter(path)(obj)
+    except (KeyError, IndexError, TypeError):
+        return default
+
+
+def set_path(obj: dict,
+             path: Path,
+             value: Any,
+             factory: Callable = dict) -> None:
+    """
+    Set the value at the dotted ``path`` of ``obj``, the missing or non
+    dict parents are replaced with ``factory()``.
+    """
+    *parents, key = path.split('.') if isinstance(path, str) else path
+    for parent in parents:
+        child = obj.get(parent)
+        if not isinstance(child, dict):
+            child = obj[parent] = factory()
+        obj = child
+    obj[key] = value
+
+
+def merge(dst: dict, src: dict) -> dict:
+    """
+    Deep update ``dst`` with ``src`` iteratively, the dicts of both are
+    merged, other values of ``src`` replace those of ``dst``.
+
+    Returns:
+        dict: ``dst``
+    """
+    stack = [(dst, src)]
+    while stack:
+        target, source = stack.pop()
+        for key, value in source.items():
+            if isinstance(value, dict):
+                child = target.get(key)
+                if isinstance(child, dict):
+                    stack.append((child, value))
+                    continue
+            target[key] = value
+    return dst
+
+
+def _view(value: Any) -> Any:
+    if isinstance(value, dict):
+        return AdvancedDictView(value)
+    if isinstance(value, list):
+        return AdvancedListView(value)
+    return value
+
+
+class AdvancedDictView(MutableMapping):
+    """
+    The lazy view of a ``dict``, with the attribute access of
+    ``AdvancedDict``.
+
+    Child dicts and lists are wrapped on first access and the wrappers are
+    memoized while the origin child is the same object. Writes go to the
+    origin dict.
+
+    The view is not a ``dict``, use ``to_dict`` where a ``dict`` is
+    expected, e.g. ``json.dumps(view.to_dict())``.
+
+    Args:
+        data (dict): the origin dict
+    """
+    __slots__ = ('_data', '_children')
+
+    def __init__(self, data: dict):
+        object.__setattr__(self, '_data', data)
+        object.__setattr__(self, '_children', dict())
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if isinstance(value, (dict, list)):
+            child = self._children.get(key)
+            # the origin may have been replaced since it was wrapped
+            if child is None or child._data is not value:
+                child = self._children[key] = _view(value)
+            return child
+        return value
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._children.pop(key, None)
+
+    def __delitem__(self, key):
+        del self._data[key]
+        self._children.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, AdvancedDictView):
+            other = other._data
+        return self._data == other
+
+    def __getattr__(self, key):
+        return self.get(key)
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def __reduce__(self):
+        return self.__class__, (self._data,)
+
+    def __repr__(self):
+        return f"ADictView({', '.join([f'{k}={v}' for k, v in self.items()])})"
+
+    def to_dict(self) -> dict:
+        """Return the origin dict."""
+        return self._data
+
+
+class AdvancedListView(MutableSequence):
+    """
+    The lazy view of a ``list`` in an ``AdvancedDictView``.
+
+    Args:
+        data (list): the origin list
+    """
+    __slots__ = ('_data', '_children')
+
+    def __init__(self, data: list):
+        self._data = data
+        self._children = dict()
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._data)))]
+        if index < 0:
+            index += len(self._data)
+            if index < 0:
+                raise IndexError('list index out of range')
+        value = self._data[index]
+        if isinstance(value, (dict, list)):
+            child = self._children.get(index)
+            if child is None or child._data is not value:
+                child = self._children[index] = _view(value)
+            return child
+        return value
+
+    def __setitem__(self, index, value):
+        self._data[index] = value
+        self._children.clear()
+
+    def __delitem__(self, index):
+        del self._data[index]
+        self._children.clear()
+
+    def insert(self, index, value):
+        self._data.insert(index, value)
+        self._children.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, AdvancedListView):
+            other = other._data
+        return self._data == other
+
+    def __reduce__(self):
+        return self.__class__, (self._data,)
+
+    def __repr__(self):
+        return f'ListView({list(self)})'
+
+    def to_list(self) -> list:
+        """Return the origin list."""
+        return self._data
+
 
 dict2ad = AdvancedDict.from_dict
+
+
+_RECORD_TYPES: Dict[tuple, type] = dict()
+
+
+def _make_record(name: str, keys: tuple, rename: bool, values: tuple):
+    return record_type(keys, name, rename)._make(values)
+
+
+def record_type(samples: Iterable[Union[dict, str]],
+                name: str = 'Record',
+                rename=False) -> type:
+    """
+    Return the immutable record class of the keys of ``samples``.
+
+    The record is a ``namedtuple`` with ``__slots__ = ()``, so it has no
+    per-instance dict. The fields are the keys of all samples in the order
+    they first appear, or the ``str`` of ``samples`` themselves. Missing
+    keys default to None. Classes are cached by name and fields, and
+    records are pickled by them, so they can be sent to other processes.
+
+    Keys which are not valid field names, e.g. ``class``, ``_id`` or
+    ``1``, raise ``ValueError`` unless ``rename=True``, which names their
+    fields by position like ``_1``. ``from_dict`` and ``to_dict`` still
+    use the original keys.
+
+    Args:
+        samples (Iterable[Union[dict, str]]): sample dicts, or field names
+        name (str): the class name
+        rename (bool): whether to rename the invalid field names
+
+    Returns:
+        type: the record class, with ``to_dict`` and ``from_dict``
+
+    Raises:
+        ValueError: a key is not a valid field name, and not ``rename``
+    """
+    keys = dict()
+    for sample in samples:
+        if isinstance(sample, dict):
+            keys.update(dict.fromkeys(sample))
+        else:
+            keys[sample] = None
+    keys = tuple(keys)
+    cls = _RECORD_TYPES.get((name, keys, rename))
+    if cls is not None:
+        return cls
+
+    base = namedtuple(name, keys, defaults=(None,) * len(keys),
+                      rename=rename)
+    field_set = frozenset(keys)
+
+    def to_dict(self) -> dict:
+        """Return the record as a ``dict``."""
+        return dict(zip(keys, self))
+
+    def __reduce__(self):
+        return _make_record, (name, keys, rename, tuple(self))
+
+    @classmethod
+    def from_dict(cls, _dict: dict):
+        """
+        Return the record of a ``dict``.
+
+        Raises:
+            ValueError: ``_dict`` has keys which are not fields
+        """
+        if not field_set.issuperset(_dict):
+            raise ValueError(f'Unknown fields of {name}',
+                             sorted(set(_dict) - field_set, key=str))
+        return cls._make(map(_dict.get, keys))
+
+    cls = type(name, (base,), {
+        '__slots__': (),
+        '__module__': __name__,
+        'to_dict': to_dict,
+        'from_dict': from_dict,
+        '__reduce__': __reduce__,
+    })
+    _RECORD_TYPES[(name, keys, rename)] = cls
+    return cls
+
+
+def dict2record(data: Union[dict, Sequence[dict]],
+                cls: type = None,
+                name: str = 'Record',
+                sample_size: int = 100,
+                rename=False) -> Union[Any, List[Any]]:
+    """
+    Return the record of a ``dict``, or the records of a list of dicts.
+
+    Args:
+        data (Union[dict, Sequence[dict]]): the dict or the dicts
+        cls (type): the record class, default inferred by ``record_type``
+            from the first ``sample_size`` dicts
+        name (str): the class name to infer
+        sample_size (int): the number of dicts to infer the class from
+        rename (bool): whether to rename the invalid field names, see
+            ``record_type``
+
+    Raises:
+        ValueError: a dict has keys which are not fields of ``cls``, or
+            keys which are not valid field names without ``rename``
+    """
+    if isinstance(data, dict):
+        return (cls or record_type([data], name, rename)).from_dict(data)
+    if cls is None:
+        cls = record_type(data[:sample_size], name, rename)
+    from_dict = cls.from_dict
+    return [from_dict(item) for item in data]
+
+
+def _column(values: list, use_numpy: bool) -> Any:
+    types = set(map(type, values))
+    if types <= {int}:
+        typecode = 'q'
+    elif types <= {int, float}:
+        typecode = 'd'
+    elif types == {bool} and use_numpy:
+        return np.array(values, dtype=np.bool_)
+    else:
+        return values
+    try:
+        if use_numpy:
+            return np.array(values,
+                            dtype=np.int64 if typecode == 'q' else np.float64)
+        return array(typecode, values)
+    except OverflowError:
+        return values
+
+
+def to_columns(rows: Sequence[dict],
+               fields: Sequence[str] = None,
+               use_numpy: bool = None) -> Dict[str, Any]:
+    """
+    Return the columns of a list of dicts.
+
+    Integer columns are ``array('q')``, numeric columns are ``array('d')``,
+    and the others are lists. With NumPy, numeric and ``bool`` columns are
+    NumPy arrays instead. Missing keys are None, which makes the column a
+    list.
+
+    Args:
+        rows (Sequence[dict]): the dicts
+        fields (Sequence[str]): the fields, default all keys of ``rows``
+        use_numpy (bool): whether to use NumPy, default if installed
+
+    Returns:
+        Dict[str, Any]: the columns by field
+
+    Raises:
+        ImportError: ``use_numpy=True`` without NumPy
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    elif use_numpy and np is None:
+        raise ImportError('NumPy is not installed')
+    if fields is None:
+        fields = dict()
+        for row in rows:
+            fields.update(dict.fromkeys(row))
+    return {field: _column([row.get(field) for row in rows], use_numpy)
+            for field in fields}
+
+
+def _tolist(column: Any) -> list:
+    if isinstance(column, list):
+        return column
+    return column.tolist()
+
+
+def from_columns(columns: Dict[str, Any]) -> List[dict]:
+    """Return the dicts of ``columns``, the opposite of ``to_columns``."""
+    fields = tuple(columns)
+    return [dict(zip(fields, row))
+            for row in zip(*map(_tolist, columns.values()))]
+
+
+def select_columns(columns: Dict[str, Any],
+                   fields: Sequence[str]) -> Dict[str, Any]:
+    """Return the ``fields`` of ``columns``, without copy."""
+    return {field: columns[field] for field in fields}
+
+
+_OPERATORS: Dict[str, Callable] = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda a, b: a in b,
+}
+
+
+def where(columns: Dict[str, Any], field: str, op: str, value: Any) -> Any:
+    """
+    Return the mask of the rows whose ``field`` compares with ``value``.
+
+    The comparison is vectorized on NumPy columns, and a C-level ``map``
+    otherwise.
+
+    Args:
+        columns (Dict[str, Any]): the columns
+        field (str): the field to compare
+        op (str): one of ``==``, ``!=``, ``<``, ``<=``, ``>``, ``>=``, ``in``
+        value (Any): the value, a collection for ``in``
+
+    Returns:
+        Any: the NumPy ``bool`` array or the list of ``bool``
+    """
+    column = columns[field]
+    func = _OPERATORS[op]
+    if np is not None and isinstance(column, np.ndarray):
+        if op == 'in':
+            return np.isin(column, list(value))
+        return func(column, value)
+    return list(map(func, column, itertools.repeat(value)))
+
+
+def _take(column: Any, indices: Sequence[int]) -> Any:
+    if np is not None and isinstance(column, np.ndarray):
+        return column[np.asarray(indices, dtype=np.intp)]
+    if isinstance(column, array):
+        return array(column.typecode, map(column.__getitem__, indices))
+    return list(map(column.__getitem__, indices))
+
+
+def take_rows(columns: Dict[str, Any],
+              indices: Sequence[int]) -> Dict[str, Any]:
+    """Return the new columns of the rows at ``indices``."""
+    return {field: _take(column, indices)
+            for field, column in columns.items()}
+
+
+def filter_rows(columns: Dict[str, Any],
+                mask: Sequence[bool]) -> Dict[str, Any]:
+    """
+    Return the new columns of the rows where ``mask`` is True.
+
+    Examples:
+        >>> filter_rows(columns, where(columns, 'age', '>=', 18))
+    """
+    if np is not None and isinstance(mask, np.ndarray):
+        return take_rows(columns, np.flatnonzero(mask))
+    result = dict()
+    for field, column in columns.items():
+        values = itertools.compress(column, mask)
+        if np is not None and isinstance(column, np.ndarray):
+            result[field] = np.fromiter(values, dtype=column.dtype)
+        elif isinstance(column, array):
+            result[field] = array(column.typecode, list(values))
+        else:
+            result[field] = list(values)
+    return result
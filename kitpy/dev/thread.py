@@ -7,7 +7,7 @@ class AdvancedThread(threading.Thread):
     def __init__(self):
         super().__init__()
         self._running = threading.Event()
-        self.setDaemon(True)
+        self.daemon = True
         self.created()
 
     def run(self) -> None:
@@ -21,7 +21,7 @@ class AdvancedThread(threading.Thread):
         self.stopped()
 
     def mounting(self) -> None:
-        while self._running.isSet():
+        while self._running.is_set():
             self.call()
 
     def created(self) -> None: ...
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""Binary serialization tools
+
+A compact tag-length-value format for ``Serializable`` objects, with the
+same ``__encode__``/``__decode__`` protocol as ``serialize``.
+
+Every value starts with a one byte tag. Integers are zigzag varints of
+any size, floats are 8 bytes, and ``str``, ``bytes``, lists and dicts are
+prefixed with their varint length. ``bytes`` are stored as they are,
+without base64. Tuples are decoded as lists, and dict keys may be of any
+supported type.
+
+"""
+import struct
+from typing import (Any, BinaryIO, Callable, Dict, Iterable, Iterator,
+                    Sequence, Union)
+
+from kitpy.experimental.serialize import Serializable
+from kitpy.experimental.serialize import _NAMES
+from kitpy.experimental.serialize import _REGISTRY
+
+NONE = 0x00
+FALSE = 0x01
+TRUE = 0x02
+INT = 0x03
+FLOAT = 0x04
+STR = 0x05
+BYTES = 0x06
+LIST = 0x07
+DICT = 0x08
+OBJECT = 0x09
+
+_DOUBLE = struct.Struct('>d')
+
+
+def _write_uint(buffer: bytearray, n: int) -> None:
+    while n > 0x7f:
+        buffer.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buffer.append(n)
+
+
+class BinaryEncoder:
+    """Streaming Binary Encoder
+
+    Encodes values into an internal buffer. With ``fp``, the buffer is
+    written to ``fp`` whenever it holds ``chunk_size`` bytes and on
+    ``flush``, so memory stays bounded for large values.
+
+    Args:
+        fp (BinaryIO): the binary file to write to, optional
+        chunk_size (int): the size at which the buffer is written out
+
+    """
+    def __init__(self, fp: BinaryIO = None, chunk_size: int = 65536):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self._methods: Dict[type, Callable] = {
+            type(None): self._encode_none,
+            bool: self._encode_bool,
+            int: self._encode_int,
+            float: self._encode_float,
+            str: self._encode_str,
+            bytes: self._encode_bytes,
+            bytearray: self._encode_bytes,
+            memoryview: self._encode_bytes,
+            list: self._encode_list,
+            tuple: self._encode_list,
+            dict: self._encode_dict,
+        }
+
+    def encode(self, o: Any) -> None:
+        """Append the encoded ``o`` to the buffer."""
+        method = self._methods.get(type(o))
+        if method is None:
+            method = self._resolve(type(o))
+        method(o)
+        if self.fp is not None and len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffer to ``fp``."""
+        if self.fp is not None and self.buffer:
+            self.fp.write(self.buffer)
+            self.buffer = bytearray()
+
+    def getvalue(self) -> bytes:
+        return bytes(self.buffer)
+
+    def _resolve(self, tp: type) -> Callable:
+        if issubclass(tp, Serializable):
+            method = self._object_encoder(tp)
+        elif issubclass(tp, bool):
+            method = self._encode_bool
+        elif issubclass(tp, int):
+            method = self._encode_int
+        elif issubclass(tp, float):
+            method = self._encode_float
+        elif issubclass(tp, str):
+            method = self._encode_str
+        elif issubclass(tp, (bytes, bytearray, memoryview)):
+            method = self._encode_bytes
+        elif issubclass(tp, (list, tuple)):
+            method = self._encode_list
+        elif issubclass(tp, dict):
+            method = self._encode_dict
+        else:
+            raise TypeError(f'Object of type {tp.__name__} '
+                            f'is not serializable')
+        self._methods[tp] = method
+        return method
+
+    def _object_encoder(self, tp: type) -> Callable:
+        name = _NAMES.get(tp, tp.__name__).encode('utf-8')
+        header = bytearray([OBJECT])
+        _write_uint(header, len(name))
+        header += name
+        encode_data = tp.__encode__
+
+        def encode_object(o: Serializable) -> None:
+            self.buffer += header
+            self.encode(encode_data(o))
+
+        return encode_object
+
+    def _encode_none(self, o: None) -> None:
+        self.buffer.append(NONE)
+
+    def _encode_bool(self, o: bool) -> None:
+        self.buffer.append(TRUE if o else FALSE)
+
+    def _encode_int(self, o: int) -> None:
+        self.buffer.append(INT)
+        _write_uint(self.buffer, o << 1 if o >= 0 else (-o << 1) - 1)
+
+    def _encode_float(self, o: float) -> None:
+        self.buffer.append(FLOAT)
+        self.buffer += _DOUBLE.pack(o)
+
+    def _encode_str(self, o: str) -> None:
+        data = o.encode('utf-8')
+        self.buffer.append(STR)
+        _write_uint(self.buffer, len(data))
+        self.buffer += data
+
+    def _encode_bytes(self, o: Union[bytes, bytearray, memoryview]) -> None:
+        self.buffer.append(BYTES)
+        _write_uint(self.buffer, len(o) if not isinstance(o, memoryview)
+                    else o.nbytes)
+        self.buffer += o
+
+    def _encode_list(self, o: Union[list, tuple]) -> None:
+        self.buffer.append(LIST)
+        _write_uint(self.buffer, len(o))
+        for item in o:
+            self.encode(item)
+
+    def _encode_dict(self, o: dict) -> None:
+        self.buffer.append(DICT)
+        _write_uint(self.buffer, len(o))
+        for key, value in o.items():
+            self.encode(key)
+            self.encode(value)
+
+
+class BinaryDecoder:
+    """Binary Decoder
+
+    Decodes the ``Serializable`` classes ``clss``, or the registered
+    classes if ``clss`` is None. Objects of unknown classes are decoded as
+    ``{'__class__': name, '__data__': data}``, like ``serialize.decode``.
+
+    Args:
+        clss (Sequence[Serializable]): the classes to decode
+
+    """
+    def __init__(self, clss: Sequence[Serializable] = None):
+        if clss is None:
+            self.decode_map = _REGISTRY
+        else:
+            self.decode_map = {_NAMES.get(cls, cls.__name__): cls
+                               for cls in clss}
+        self._data: memoryview = memoryview(b'')
+        self._pos = 0
+
+    def decode(self, data: Union[bytes, bytearray, memoryview]) -> Any:
+        """
+        Decode one value which fills ``data``.
+
+        Raises:
+            ValueError: the data is truncated or has extra bytes
+        """
+        self._data = memoryview(data).cast('B')
+        self._pos = 0
+        try:
+            result = self._decode()
+        except IndexError:
+            raise ValueError('Truncated binary data') from None
+        if self._pos != len(self._data):
+            raise ValueError('Extra binary data', len(self._data) - self._pos)
+        return result
+
+    def _read_uint(self) -> int:
+        data, pos = self._data, self._pos
+        result = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        self._pos = pos
+        return result
+
+    def _read(self, size: int) -> memoryview:
+        start = self._pos
+        self._pos = start + size
+        if self._pos > len(self._data):
+            raise IndexError(self._pos)
+        return self._data[start:self._pos]
+
+    def _decode(self) -> Any:
+        tag = self._data[self._pos]
+        self._pos += 1
+        if tag == STR:
+            return str(self._read(self._read_uint()), 'utf-8')
+        if tag == INT:
+            n = self._read_uint()
+            return n >> 1 if not n & 1 else -((n + 1) >> 1)
+        if tag == FLOAT:
+            return _DOUBLE.unpack(self._read(8))[0]
+        if tag == DICT:
+            size = self._read_uint()
+            result = dict()
+            for _ in range(size):
+                key = self._decode()
+                result[key] = self._decode()
+            return result
+        if tag == LIST:
+            return [self._decode() for _ in range(self._read_uint())]
+        if tag == NONE:
+            return None
+        if tag == TRUE:
+            return True
+        if tag == FALSE:
+            return False
+        if tag == BYTES:
+            return bytes(self._read(self._read_uint()))
+        if tag == OBJECT:
+            name = str(self._read(self._read_uint()), 'utf-8')
+            data = self._decode()
+            cls = self.decode_map.get(name)
+            if cls is None:
+                return {'__class__': name, '__data__': data}
+            return cls.__decode__(data)
+        raise ValueError('Unknown binary tag', tag)
+
+
+def encode(o: Any) -> bytes:
+    encoder = BinaryEncoder()
+    encoder.encode(o)
+    return encoder.getvalue()
+
+
+def encode_into(o: Any,
+                buffer: Union[bytearray, memoryview],
+                offset: int = 0) -> int:
+    """
+    Encode ``o`` into a writable buffer at ``offset``.
+
+    Returns:
+        int: the number of bytes written
+
+    Raises:
+        ValueError: the buffer is too small
+    """
+    data = encode(o)
+    view = memoryview(buffer).cast('B')
+    if offset + len(data) > len(view):
+        raise ValueError('Buffer too small', offset + len(data))
+    view[offset:offset + len(data)] = data
+    return len(data)
+
+
+def decode(data: Union[bytes, bytearray, memoryview],
+           clss: Union[Sequence[Serializable], Serializable] = None) -> Any:
+    if isinstance(clss, type):
+        clss = [clss]
+    return BinaryDecoder(clss).decode(data)
+
+
+def dump(o: Any, fp: BinaryIO, chunk_size: int = 65536) -> None:
+    encoder = BinaryEncoder(fp, chunk_size)
+    encoder.encode(o)
+    encoder.flush()
+
+
+def load(fp: BinaryIO,
+         clss: Union[Sequence[Serializable], Serializable] = None) -> Any:
+    return decode(fp.read(), clss)
+
+
+def dump_stream(iterable: Iterable[Any],
+                fp: BinaryIO,
+                chunk_size: int = 65536) -> int:
+    """
+    Write the objects of ``iterable`` to ``fp`` as frames, each is the
+    varint length and the encoded object.
+
+    Returns:
+        int: the number of objects written
+    """
+    encoder = BinaryEncoder()
+    frames = bytearray()
+    count = 0
+    for o in iterable:
+        encoder.encode(o)
+        _write_uint(frames, len(encoder.buffer))
+        frames += encoder.buffer
+        encoder.buffer.clear()
+        count += 1
+        if len(frames) >= chunk_size:
+            fp.write(frames)
+            frames.clear()
+    if frames:
+        fp.write(frames)
+    return count
+
+
+def load_stream(fp: BinaryIO,
+                clss: Union[Sequence[Serializable], Serializable] = None,
+                chunk_size: int = 65536) -> Iterator[Any]:
+    """
+    Read the frames written by ``dump_stream`` lazily, ``chunk_size``
+    bytes at a time.
+
+    Raises:
+        ValueError: the stream ends in the middle of a frame
+    """
+    if isinstance(clss, type):
+        clss = [clss]
+    decoder = BinaryDecoder(clss)
+    buffer = bytearray()
+    pos = 0
+    eof = False
+    while True:
+        size = shift = 0
+        end = pos
+        while end < len(buffer):
+            byte = buffer[end]
+            end += 1
+            size |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        else:
+            end = -1
+        if end != -1 and end + size <= len(buffer):
+            yield decoder.decode(buffer[end:end + size])
+            pos = end + size
+            continue
+        if eof:
+            if pos != len(buffer):
+                raise ValueError('Truncated binary stream')
+            return
+        del buffer[:pos]
+        pos = 0
+        chunk = fp.read(max(chunk_size, size - len(buffer)))
+        if chunk:
+            buffer += chunk
+        else:
+            eof = True
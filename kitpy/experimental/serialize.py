@@ -6,7 +6,12 @@ Serialization & Deserialization
 """
 
 import json
-from typing import Any, Callable, Sequence, Union
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import (Any, Callable, Dict, IO, Iterable, Iterator, List,
+                    Optional, Sequence, Type, Union)
+
+from kitpy import jsonz
 
 
 class Serializable(object):
@@ -18,57 +23,450 @@ class Serializable(object):
         return NotImplemented
 
 
+_REGISTRY: Dict[str, Type[Serializable]] = dict()
+_NAMES: Dict[Type[Serializable], str] = dict()
+_ENCODERS: Dict[type, Any] = dict()
+_PURE_ENCODERS: Dict[type, Any] = dict()
+
+
+def register(cls: Type[Serializable] = None, name: str = None):
+    """
+    Class decorator which registers a ``Serializable`` class.
+
+    Registered classes are encoded with ``name`` as ``__class__``, and are
+    decoded by ``decode`` and ``AdvancedDecoder`` when no classes are
+    given.
+
+    Examples:
+        >>> @register
+        >>> class People(Serializable): ...
+        >>>
+        >>> @register(name='Person')
+        >>> class People(Serializable): ...
+
+    Args:
+        cls (Type[Serializable]): the class
+        name (str): the registered name, default ``cls.__name__``
+    """
+    def wrapper(_cls: Type[Serializable]) -> Type[Serializable]:
+        if not (isinstance(_cls, type) and issubclass(_cls, Serializable)):
+            raise TypeError('Expect cls `Serializable`, got', _cls)
+        _name = name or _cls.__name__
+        _REGISTRY[_name] = _cls
+        _NAMES[_cls] = _name
+        _ENCODERS.clear()
+        return _cls
+
+    if cls is not None:
+        return wrapper(cls)
+    return wrapper
+
+
+def _compile_encoder(tp: type, pure: bool):
+    """Build and cache the encoder function of ``tp``, False if none."""
+    encoder = False
+    if issubclass(tp, Serializable):
+        encode_data = tp.__encode__
+        if pure:
+            encoder = encode_data
+        else:
+            name = _NAMES.get(tp, tp.__name__)
+
+            def encoder(obj: Serializable) -> dict:
+                return {'__class__': name, '__data__': encode_data(obj)}
+    (_PURE_ENCODERS if pure else _ENCODERS)[tp] = encoder
+    return encoder
+
+
 class AdvancedEncoder(json.JSONEncoder):
     def default(self, obj: Any) -> Any:
-        if isinstance(obj, Serializable):
-            return {
-                '__class__': str(type(obj).__name__),
-                '__data__': obj.__encode__()
-            }
+        encoder = _ENCODERS.get(type(obj))
+        if encoder is None:
+            encoder = _compile_encoder(type(obj), False)
+        if encoder:
+            return encoder(obj)
         return super().default(obj)
 
 
 class PureEncoder(json.JSONEncoder):
+    def default(self, obj: Any) -> Any:
+        encoder = _PURE_ENCODERS.get(type(obj))
+        if encoder is None:
+            encoder = _compile_encoder(type(obj), True)
+        if encoder:
+            return encoder(obj)
+        return super().default(obj)
+
+
+# The encoders which only have a ``default``, so ``jsonz`` can use it
+_DEFAULT_ENCODERS = (AdvancedEncoder, PureEncoder)
+
+
+class ReferenceEncoder(AdvancedEncoder):
+    """Reference-preserving Encoder
+
+    Encodes the first occurrence of each ``Serializable`` instance with an
+    ``__id__``, and the later ones as ``{"__ref__": id}``, so shared and
+    cyclic objects are encoded once. ``check_circular`` is always False.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs['check_circular'] = False
+        super().__init__(*args, **kwargs)
+        self._memo: Dict[int, tuple] = dict()
+
+    def iterencode(self, o: Any, _one_shot=False):
+        self._memo = dict()
+        return super().iterencode(o, _one_shot)
+
     def default(self, obj: Any) -> Any:
         if isinstance(obj, Serializable):
-            return obj.__encode__()
+            entry = self._memo.get(id(obj))
+            if entry is not None:
+                return {'__ref__': entry[0]}
+            index = len(self._memo)
+            # keeps obj alive, so its id is not reused by a temporary
+            self._memo[id(obj)] = (index, obj)
+            return {'__class__': _NAMES.get(type(obj), type(obj).__name__),
+                    '__id__': index,
+                    '__data__': obj.__encode__()}
         return super().default(obj)
 
 
-def AdvancedDecoder(clss: Sequence[Serializable]) -> Callable:
-    decode_map = dict()
+class Reference(object):
+    """Placeholder of a cyclic reference whose object is not decoded yet."""
+    __slots__ = ('id',)
 
-    if isinstance(clss, (tuple, list)):
+    def __init__(self, id: int):
+        self.id = id
+
+    def __repr__(self) -> str:
+        return f'Reference({self.id})'
+
+
+class References(dict):
+    """The decoded objects by ``__id__``
+
+    ``pending`` is True once a ``Reference`` has been returned, which
+    ``patch`` replaces with the decoded object.
+    """
+    pending = False
+
+    def resolve(self, index: int) -> Any:
+        if index in self:
+            return self[index]
+        self.pending = True
+        return Reference(index)
+
+    def patch(self, root: Any) -> Any:
+        """Replace the ``Reference`` left in lists, dicts and attributes."""
+        if isinstance(root, Reference):
+            return self[root.id]
+        visited = set()
+        stack = [root, *self.values()]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in visited:
+                continue
+            visited.add(id(obj))
+            if isinstance(obj, list):
+                items = enumerate(obj)
+            elif isinstance(obj, dict):
+                items = obj.items()
+            elif isinstance(obj, Serializable) and hasattr(obj, '__dict__'):
+                obj = vars(obj)
+                items = obj.items()
+            else:
+                continue
+            for key, value in list(items):
+                if isinstance(value, Reference):
+                    obj[key] = self[value.id]
+                elif isinstance(value, (list, dict, Serializable)):
+                    stack.append(value)
+        self.pending = False
+        return root
+
+
+def AdvancedDecoder(clss: Sequence[Serializable] = None,
+                    refs: References = None) -> Callable:
+    """
+    Build the ``object_hook`` which decodes the classes ``clss``, or the
+    registered classes if ``clss`` is None.
+
+    With ``refs``, the decoded objects are stored in ``refs`` by their
+    ``__id__``, and ``{"__ref__": id}`` is decoded as the same object, or
+    as a ``Reference`` to ``refs.patch`` if it is not decoded yet.
+    """
+    if clss is None:
+        decode_map = _REGISTRY
+    elif isinstance(clss, (tuple, list)):
+        decode_map = dict()
         for cls in clss:
             if not issubclass(cls, Serializable):
                 raise TypeError('Expect cls `Serializable`, got',
                                 type(cls))
-            decode_map[cls.__name__] = cls
+            decode_map[_NAMES.get(cls, cls.__name__)] = cls
     else:
         raise TypeError('Expect clss `[Serializable]`, got', clss)
 
+    get_cls = decode_map.get
+
     def object_hook(o: dict) -> Any:
-        if '__class__' in o and o['__class__'] in decode_map:
-            return decode_map[o['__class__']].__decode__(o['__data__'])
+        name = o.get('__class__')
+        if name is not None:
+            cls = get_cls(name)
+            if cls is not None:
+                return cls.__decode__(o['__data__'])
         return o
 
-    return object_hook
+    if refs is None:
+        return object_hook
+
+    def reference_hook(o: dict) -> Any:
+        if '__ref__' in o and len(o) == 1:
+            return refs.resolve(o['__ref__'])
+        obj = object_hook(o)
+        if '__id__' in o and '__class__' in o:
+            refs[o['__id__']] = obj
+        return obj
+
+    return reference_hook
 
 
-def encode(o: Any, cls: json.JSONEncoder = None) -> str:
+def encode(o: Any,
+           cls: json.JSONEncoder = None,
+           indent: Optional[int] = None,
+           separators: Optional[tuple] = None,
+           ensure_ascii=True,
+           refs=False) -> str:
+    """
+    Serialize ``o`` to a JSON ``str`` with the encoder ``cls``,
+    ``AdvancedEncoder`` by default.
+
+    The options are the same as ``json.JSONEncoder``. For
+    ``AdvancedEncoder`` and ``PureEncoder``, the fast backend of ``jsonz``
+    is used with their ``default`` and ``separators=(',', ':')`` and
+    ``ensure_ascii=False``. Any other encoder encodes ``o`` itself.
+
+    With ``refs=True``, ``cls`` defaults to ``ReferenceEncoder``, shared
+    and cyclic ``Serializable`` instances are encoded once, and ``decode``
+    restores their identity. The encoder of ``json`` is always used, as
+    the memo of references can not be replayed by a fallback.
+    """
     if cls is not None:
         if not issubclass(cls, json.JSONEncoder):
             raise TypeError('Expect cls `json.JSONEncoder`, got', cls)
     else:
-        cls = AdvancedEncoder
-    return cls().encode(o)
+        cls = ReferenceEncoder if refs else AdvancedEncoder
+    if refs:
+        return cls(indent=indent,
+                   separators=separators,
+                   ensure_ascii=ensure_ascii,
+                   check_circular=False).encode(o)
+    if cls not in _DEFAULT_ENCODERS:
+        return cls(indent=indent,
+                   separators=separators,
+                   ensure_ascii=ensure_ascii).encode(o)
+    return jsonz.dumps(o,
+                       indent=indent,
+                       separators=separators,
+                       ensure_ascii=ensure_ascii,
+                       default=cls().default)
 
 
-def decode(s: str, clss: Union[Sequence[Serializable], Serializable] = None) -> Any:
+def _object_hook(clss: Union[Sequence[Serializable], Serializable, None],
+                 refs: References = None) -> Optional[Callable]:
+    """Build the ``object_hook`` of ``clss``, None if nothing to decode."""
     if clss is None:
-        return json.loads(s)
+        if not _REGISTRY and refs is None:
+            return None
+        return AdvancedDecoder(refs=refs)
     if isinstance(clss, (tuple, list)):
-        return json.loads(s, object_hook=AdvancedDecoder(clss))
+        return AdvancedDecoder(clss, refs)
     if issubclass(clss, Serializable):
-        return json.loads(s, object_hook=AdvancedDecoder([clss]))
+        return AdvancedDecoder([clss], refs)
     raise TypeError('Expect clss `[Serializable]` or None, got', type(clss))
+
+
+def decode(s: str, clss: Union[Sequence[Serializable], Serializable] = None) -> Any:
+    """
+    Deserialize a JSON ``str``, decoding the ``Serializable`` classes
+    ``clss``, or the registered classes if ``clss`` is None.
+
+    Documents without any ``__class__`` marker skip the ``object_hook``.
+    Documents encoded with ``refs=True`` have the shared objects restored,
+    cyclic references are patched in lists, dicts and attributes, so a
+    ``__decode__`` which copies them elsewhere gets a ``Reference``.
+    """
+    if '"__class__"' not in s:
+        return jsonz.loads(s)
+    if '"__id__"' not in s:
+        return jsonz.loads(s, object_hook=_object_hook(clss))
+    refs = References()
+    result = jsonz.loads(s, object_hook=_object_hook(clss, refs))
+    if refs.pending:
+        result = refs.patch(result)
+    return result
+
+
+def encode_stream(iterable: Iterable[Any],
+                  fp: IO,
+                  fmt: str = 'jsonl',
+                  cls: json.JSONEncoder = None,
+                  batch_size: int = 1000) -> int:
+    """
+    Serialize the objects of ``iterable`` to ``fp`` one by one, so the
+    memory does not grow with the number of objects.
+
+    With ``fmt='jsonl'``, ``fp`` is a text file and each object is a
+    compact JSON line encoded with ``cls`` as in ``encode``, ``batch_size``
+    lines are written at a time. With ``fmt='binary'``, ``fp`` is a binary
+    file and each object is a length-prefixed ``binary`` frame, ``cls`` is
+    ignored.
+
+    Returns:
+        int: the number of objects written
+    """
+    if fmt == 'binary':
+        from kitpy.experimental import binary
+        return binary.dump_stream(iterable, fp)
+    if fmt != 'jsonl':
+        raise ValueError('Expect fmt `jsonl` or `binary`, got', fmt)
+    if cls is not None:
+        if not issubclass(cls, json.JSONEncoder):
+            raise TypeError('Expect cls `json.JSONEncoder`, got', cls)
+    else:
+        cls = AdvancedEncoder
+    if cls in _DEFAULT_ENCODERS:
+        default = cls().default
+
+        def dumps(o: Any) -> str:
+            return jsonz.dumps(o,
+                               separators=jsonz.COMPACT,
+                               ensure_ascii=False,
+                               default=default)
+    else:
+        dumps = cls(separators=jsonz.COMPACT, ensure_ascii=False).encode
+    count = 0
+    lines = []
+    for o in iterable:
+        lines.append(dumps(o))
+        count += 1
+        if len(lines) >= batch_size:
+            lines.append('')
+            fp.write('\n'.join(lines))
+            lines.clear()
+    if lines:
+        lines.append('')
+        fp.write('\n'.join(lines))
+    return count
+
+
+def decode_stream(fp: IO,
+                  clss: Union[Sequence[Serializable], Serializable] = None,
+                  fmt: str = 'jsonl') -> Iterator[Any]:
+    """
+    Deserialize the objects written by ``encode_stream`` lazily, decoding
+    the ``Serializable`` classes ``clss``, or the registered classes if
+    ``clss`` is None. Blank JSON lines are skipped.
+    """
+    if fmt == 'binary':
+        from kitpy.experimental import binary
+        yield from binary.load_stream(fp, clss)
+        return
+    if fmt != 'jsonl':
+        raise ValueError('Expect fmt `jsonl` or `binary`, got', fmt)
+    object_hook = _object_hook(clss)
+    for line in fp:
+        if not line.strip():
+            continue
+        if object_hook is None or '"__class__"' not in line:
+            yield jsonz.loads(line)
+        else:
+            yield jsonz.loads(line, object_hook=object_hook)
+
+
+def _encode_chunk(chunk: Sequence[Any], cls: json.JSONEncoder,
+                  kwargs: dict) -> List[str]:
+    return [encode(o, cls, **kwargs) for o in chunk]
+
+
+def _decode_chunk(chunk: Sequence[str], clss) -> List[Any]:
+    return [decode(s, clss) for s in chunk]
+
+
+def _map_chunks(func: Callable,
+                items: Sequence[Any],
+                args: tuple,
+                executor: Optional[Executor],
+                workers: Optional[int],
+                chunk_size: Optional[int],
+                threshold: int) -> List[Any]:
+    """Apply ``func`` on chunks of ``items``, in a pool above ``threshold``."""
+    items = items if isinstance(items, (list, tuple)) else list(items)
+    if executor is None:
+        workers = workers or os.cpu_count() or 1
+    if len(items) < threshold or workers == 1:
+        return func(items, *args)
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(items) // ((workers or 4) * 4)))
+    chunks = [items[i:i + chunk_size]
+              for i in range(0, len(items), chunk_size)]
+    extra = [[arg] * len(chunks) for arg in args]
+    result = []
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(func, chunks, *extra):
+                result.extend(part)
+    else:
+        for part in executor.map(func, chunks, *extra):
+            result.extend(part)
+    return result
+
+
+def encode_many(objs: Sequence[Any],
+                cls: json.JSONEncoder = None,
+                executor: Executor = None,
+                workers: int = None,
+                chunk_size: int = None,
+                threshold: int = 10000,
+                **kwargs) -> List[str]:
+    """
+    Serialize each object of ``objs`` by ``encode``, in chunks across a
+    ``ProcessPoolExecutor``, or ``executor`` if given.
+
+    The result is in the order of ``objs`` and the same as the serial
+    ``[encode(o, cls, **kwargs) for o in objs]``, which is used when there
+    are less than ``threshold`` objects or a single worker.
+
+    The objects and ``cls`` are pickled to the workers, so the classes
+    must be importable, and registered when their module is imported.
+
+    Args:
+        objs (Sequence[Any]): the objects
+        cls (json.JSONEncoder): the encoder, ``AdvancedEncoder`` by default
+        executor (Executor): the executor to reuse, optional
+        workers (int): the number of processes, default ``os.cpu_count()``
+        chunk_size (int): the number of objects per task, default about
+            a quarter of the objects per worker
+        threshold (int): the number of objects below which stays serial
+        **kwargs: the options of ``encode``
+    """
+    return _map_chunks(_encode_chunk, objs, (cls, kwargs),
+                       executor, workers, chunk_size, threshold)
+
+
+def decode_many(strings: Sequence[str],
+                clss: Union[Sequence[Serializable], Serializable] = None,
+                executor: Executor = None,
+                workers: int = None,
+                chunk_size: int = None,
+                threshold: int = 10000) -> List[Any]:
+    """
+    Deserialize each ``str`` of ``strings`` by ``decode``, in chunks
+    across a ``ProcessPoolExecutor``, the opposite of ``encode_many``.
+
+    With ``clss=None``, the workers decode the classes registered in
+    their own process.
+    """
+    return _map_chunks(_decode_chunk, strings, (clss,),
+                       executor, workers, chunk_size, threshold)
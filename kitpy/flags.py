@@ -1,30 +1,169 @@
 # -*- coding: utf-8 -*-
-from typing import Any
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Mapping
 
 from kitpy.singleton import Singleton
 
+_MISSING = object()
+_TRUE = ('1', 'true', 'yes', 'on')
+_FALSE = ('0', 'false', 'no', 'off', '')
+
+
+def _convert(tp: type, value: Any) -> Any:
+    if value is None or isinstance(value, tp):
+        return value
+    if tp is bool and isinstance(value, str):
+        if value.lower() in _TRUE:
+            return True
+        if value.lower() in _FALSE:
+            return False
+        raise ValueError('Expect a bool, got', value)
+    return tp(value)
+
 
 class Flags(Singleton):
     """Global Parameters Manager
 
     This is a Singleton Class
+
+    The flags live in a plain ``dict`` which is never modified once
+    published. Reads use the current ``dict`` without locking, writes copy
+    it under a lock and swap the copy in, then notify the subscribers.
+
+    The flags are also published in the instance ``__dict__``, so reading
+    ``FLAGS.name`` is a plain attribute lookup. Flags which are named like
+    a method or start with ``_`` are only read by ``get``.
     """
-    def __getattribute__(self, key: str, default: Any = None) -> Any:
-        try:
-            return super().__getattribute__(key)
-        except AttributeError:
-            return default
+    def __init__(self):
+        object.__setattr__(self, '_types', dict())
+        object.__setattr__(self, '_subscribers', ())
+        object.__setattr__(self, '_lock', threading.RLock())
+        self._publish(dict())
+
+    def __getattr__(self, key: str) -> Any:
+        if key.startswith('__') or key in ('_values', '_types'):
+            raise AttributeError(key)
+        return self._values.get(key)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    def __delattr__(self, key: str) -> None:
+        self.delete(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._values
 
     def get(self, key: str, default: Any = None) -> Any:
         """Get the value of an argument
 
         If not found, return default
         """
-        return self.__getattribute__(key, default)
+        return self._values.get(key, default)
 
     def set(self, key: str, value: Any) -> None:
-        """Set the value of an argument"""
-        self.__setattr__(key, value)
+        """Set the value of an argument
+
+        The value is converted to the type given by ``define``.
+        """
+        self.update({key: value})
+
+    def update(self, values: Mapping[str, Any]) -> None:
+        """Set the values of arguments at once"""
+        with self._lock:
+            current = self._values
+            types = self._types
+            changes = []
+            for key, value in values.items():
+                if key in types:
+                    value = _convert(types[key], value)
+                old = current.get(key, _MISSING)
+                if old is value or (old is not _MISSING and old == value):
+                    continue
+                changes.append((key, old, value))
+            if not changes:
+                return
+            new = dict(current)
+            for key, _, value in changes:
+                new[key] = value
+            self._publish(new)
+        self._notify(changes)
+
+    def delete(self, key: str) -> None:
+        """Delete an argument, and its type given by ``define``"""
+        with self._lock:
+            self._types.pop(key, None)
+            if key not in self._values:
+                return
+            new = dict(self._values)
+            old = new.pop(key)
+            self._publish(new)
+        self._notify([(key, old, None)])
+
+    def define(self, key: str, default: Any = None, type: type = None) -> None:
+        """Define an argument with its default value and type
+
+        The type defaults to the type of ``default``. The current value,
+        if any, is kept and converted.
+
+        Raises:
+            ValueError: the current value can not be converted
+        """
+        if type is None and default is not None:
+            type = default.__class__
+        with self._lock:
+            value = self._values.get(key, default)
+            if type is not None:
+                value = _convert(type, value)
+                self._types[key] = type
+            self.update({key: value})
+
+    def snapshot(self) -> Mapping[str, Any]:
+        """Return a read-only and consistent view of all arguments"""
+        return MappingProxyType(self._values)
+
+    def subscribe(self, callback: Callable[[str, Any, Any], Any],
+                  key: str = None) -> Callable:
+        """Subscribe to the changes of ``key``, or all arguments if None
+
+        ``callback(key, old, new)`` is called after the change in the
+        thread of the writer, ``old`` or ``new`` is None when the argument
+        did not exist or is deleted.
+        """
+        with self._lock:
+            object.__setattr__(self, '_subscribers',
+                               self._subscribers + ((key, callback),))
+        return callback
+
+    def unsubscribe(self, callback: Callable) -> None:
+        with self._lock:
+            object.__setattr__(self, '_subscribers', tuple(
+                (key, func) for key, func in self._subscribers
+                if func is not callback))
+
+    def _publish(self, values: dict) -> None:
+        # The instance ``__dict__`` is replaced at once, so a reader never
+        # sees a half published write.
+        state = {key: value for key, value in values.items()
+                 if isinstance(key, str) and not key.startswith('_')
+                 and not hasattr(Flags, key)}
+        state['_values'] = values
+        state['_types'] = self._types
+        state['_subscribers'] = self._subscribers
+        state['_lock'] = self._lock
+        object.__setattr__(self, '__dict__', state)
+
+    def _notify(self, changes: list) -> None:
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        for key, old, new in changes:
+            if old is _MISSING:
+                old = None
+            for target, callback in subscribers:
+                if target is None or target == key:
+                    callback(key, old, new)
 
 
 FLAGS = Flags()
@@ -1,8 +1,22 @@
 # -*- coding: utf-8 -*-
+import atexit
+import gzip
+import json
 import logging
 import logging.handlers
+import lzma
+import multiprocessing
+import multiprocessing.connection
 import os
+import pickle
+import queue
+import random
+import shutil
+import socket
+import sys
+import threading
 import time
+import traceback
 
 from kitpy.singleton import Singleton
 from kitpy.convert import AdvancedDict
@@ -12,6 +26,7 @@ from kitpy.project import ROOT
 DEFAULT_CFG = {
     'enable': True,
     'level': 'info',
+    'format': 'text',
     'fmt': '%(asctime)s.%(msecs)03d [%(levelname)s] >%(name)s: %(message)s',
     'datefmt': '%Y-%m-%d %H:%M:%S',
     'file': {
@@ -25,14 +40,176 @@ DEFAULT_CFG = {
         'month': True,
         'error_enable': True,
         'error_suffix': '.error',
+        'backup_count': 0,
+        'compress': None,
+        'buffer_size': 0,
+        'flush_interval': 0.2,
+        'flush_level': 'error',
     },
     'console': {
         'enable': 'true',
         'level': 'info',
     },
+    'multiprocess': {
+        'enable': False,
+        'host': '127.0.0.1',
+        'port': 0,
+    },
+    'sampling': {
+        'enable': False,
+        'level': 'info',
+        'rate': 1.0,
+        'loggers': {},
+    },
+    'rate_limit': {
+        'enable': False,
+        'rate': 10,
+        'burst': 20,
+        'interval': 10,
+        'loggers': {},
+    },
+    'async': False,
+    'queue': {
+        'size': 10000,
+        'overflow': 'block',
+        'sample': 10,
+    },
+}
+
+
+_RECORD_ATTRS = frozenset(
+    vars(logging.LogRecord('', logging.INFO, '', 0, '', (), None))
+) | {'message', 'asctime'}
+
+
+class Formatter(logging.Formatter):
+    """
+    Formatter which formats ``asctime`` once per second, instead of calling
+    ``time.strftime`` for every record.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._time_cache = (None, None, '')
+
+    def formatTime(self, record: logging.LogRecord, datefmt=None) -> str:
+        second = int(record.created)
+        cached_second, cached_datefmt, cached = self._time_cache
+        if second != cached_second or datefmt != cached_datefmt:
+            cached = time.strftime(datefmt or self.default_time_format,
+                                   self.converter(second))
+            self._time_cache = (second, datefmt, cached)
+        if not datefmt and self.default_msec_format:
+            return self.default_msec_format % (cached, record.msecs)
+        return cached
+
+
+class JsonFormatter(Formatter):
+    """
+    Formatter which produces one JSON object per record.
+
+    ``fields`` maps the output keys to ``LogRecord`` attributes, where
+    ``asctime`` is the time with milliseconds and ``message`` is the merged
+    message. Attributes passed with ``extra`` are added under their own
+    names, and the formatted exception and stack under ``exc_info`` and
+    ``stack_info``.
+    """
+    DEFAULT_FIELDS = {
+        'timestamp': 'asctime',
+        'level': 'levelname',
+        'logger': 'name',
+        'message': 'message',
+    }
+
+    def __init__(self, fields: dict = None, datefmt=None, ensure_ascii=False):
+        super().__init__(datefmt=datefmt or '%Y-%m-%d %H:%M:%S')
+        self.fields = tuple((fields or self.DEFAULT_FIELDS).items())
+        self._asctime = any(attr == 'asctime' for _, attr in self.fields)
+        self._encode = json.JSONEncoder(ensure_ascii=ensure_ascii,
+                                        default=str).encode
+
+    def usesTime(self) -> bool:
+        return self._asctime
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.message = record.getMessage()
+        if self._asctime:
+            record.asctime = '%s.%03d' % (
+                self.formatTime(record, self.datefmt), record.msecs)
+        data = {key: getattr(record, attr, None) for key, attr in self.fields}
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc_info'] = record.exc_text
+        if record.stack_info:
+            data['stack_info'] = self.formatStack(record.stack_info)
+        return self._encode(data)
+
+
+COMPRESSORS = {
+    'gzip': (gzip.open, '.gz'),
+    'lzma': (lzma.open, '.xz'),
 }
 
 
+def compress_file(filename: str, compress: str) -> str:
+    """
+    Compress a file with ``gzip`` or ``lzma`` and remove the original.
+
+    The compressed file is written aside and moved into place, so an
+    interrupted compression never leaves a truncated archive.
+
+    Returns:
+        str: the compressed file name
+    """
+    opener, ext = COMPRESSORS[compress]
+    target = filename + ext
+    with open(filename, 'rb') as src, opener(target + '.tmp', 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(target + '.tmp', target)
+    os.remove(filename)
+    return target
+
+
+class Archiver(Singleton):
+    """
+    Background worker which runs the archiving jobs of rotated log files,
+    so that a rollover only costs the logging thread a rename.
+
+    This is a Singleton Class
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self._thread: threading.Thread = None
+
+    def put(self, func, *args) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name='LogArchiver',
+                                                daemon=True)
+                self._thread.start()
+        self.queue.put((func, args))
+
+    def join(self) -> None:
+        """Wait until all jobs are done."""
+        self.queue.join()
+
+    def _run(self) -> None:
+        while True:
+            func, args = self.queue.get()
+            try:
+                func(*args)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+            finally:
+                self.queue.task_done()
+
+
 class TimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
     """
     Handler for logging to a file, rotating the log file at certain timed
@@ -43,6 +220,12 @@ class TimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
 
     Based on Timed Rotating FileHandler modifications, month-based
     archiving has been added
+
+    If ``compress`` is ``'gzip'`` or ``'lzma'``, rotated files are
+    compressed. With ``background``, compression and the removal of old
+    files run in the ``Archiver`` thread instead of the logging thread.
+    With ``month_archiving``, ``backupCount`` counts the rotated files of
+    all month directories.
     """
 
     def __init__(self,
@@ -54,20 +237,20 @@ class TimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
                  delay=False,
                  utc=False,
                  atTime=None,
-                 month_archiving=False):
+                 month_archiving=False,
+                 compress=None,
+                 background=False):
+        if compress is not None and compress not in COMPRESSORS:
+            raise ValueError('Unknown compress', compress)
+        self.compress = compress
+        self.background = background
         self.month_archiving = month_archiving
+        self.month_rollover_at = 0
         if self.month_archiving:
-            dir_name, base_name = os.path.split(filename)
-            mon_name = os.path.join(
-                dir_name,
-                time.strftime('%Y-%m', time.localtime(time.time()))
-            )
-            if not os.path.exists(mon_name):
-                os.mkdir(mon_name)
-            filename = os.path.join(
-                mon_name,
-                base_name
-            )
+            dir_name, base_name = os.path.split(os.path.abspath(filename))
+            self.month_root = dir_name
+            self.month_base = base_name
+            filename = self.compute_month_filename(int(time.time()))
 
         super().__init__(
             filename,
@@ -79,26 +262,132 @@ class TimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
             utc=utc,
             atTime=atTime
         )
+        if self.compress or self.background:
+            self.rotator = self.archive
+
+    @staticmethod
+    def compute_month_rollover(current_time: int) -> int:
+        """
+        Work out the epoch timestamp of the first second of the month
+        after ``current_time``, in local time.
+        """
+        t = time.localtime(current_time)
+        year, month = t.tm_year, t.tm_mon + 1
+        if month > 12:
+            year, month = year + 1, 1
+        return int(time.mktime((year, month, 1, 0, 0, 0, 0, 0, -1)))
+
+    def compute_month_filename(self, current_time: int) -> str:
+        """
+        Create the month directory of ``current_time`` and return the log
+        file path inside it. The next month boundary is precomputed, so that
+        ``update_month_archiving`` only needs one comparison.
+        """
+        mon_name = os.path.join(
+            self.month_root,
+            time.strftime('%Y-%m', time.localtime(current_time))
+        )
+        os.makedirs(mon_name, exist_ok=True)
+        self.month_rollover_at = self.compute_month_rollover(current_time)
+        return os.path.join(
+            mon_name,
+            self.month_base
+        )
 
     def update_month_archiving(self):
+        if not self.month_archiving:
+            return
+        current_time = int(time.time())
+        if current_time < self.month_rollover_at:
+            return
+        self.baseFilename = self.compute_month_filename(current_time)
+
+    def archive(self, source: str, dest: str) -> None:
+        """Rotator which renames the file and archives it."""
+        if not os.path.exists(source):
+            return
+        os.rename(source, dest)
+        if self.background:
+            Archiver().put(self.archive_files)
+        elif self.compress:
+            compress_file(dest, self.compress)
+
+    def archive_files(self) -> None:
+        """
+        Compress the rotated files which are not compressed yet, and remove
+        the expired ones and the emptied month directories.
+        """
+        for filename, compressed in self.get_rotated_files():
+            if self.compress and not compressed:
+                compress_file(filename, self.compress)
+        if self.backupCount > 0:
+            for filename in self.get_expired_files():
+                os.remove(filename)
         if self.month_archiving:
-            now_month = time.strftime('%Y-%m', time.localtime(time.time()))
-            dir_name, base_name = os.path.split(self.baseFilename)
-            dir_name, month = os.path.split(dir_name)
+            current = os.path.dirname(self.baseFilename)
+            for dir_name in self.get_rotated_dirs():
+                if dir_name != current and not os.listdir(dir_name):
+                    try:
+                        os.rmdir(dir_name)
+                    except OSError:
+                        pass
 
-            if month == now_month:
-                return
+    def get_rotated_dirs(self) -> list:
+        """
+        Return the directories of the rotated files, which are all the month
+        directories with ``month_archiving``, from the oldest.
+        """
+        if not self.month_archiving:
+            return [os.path.dirname(self.baseFilename)]
+        result = []
+        for name in sorted(os.listdir(self.month_root)):
+            try:
+                time.strptime(name, '%Y-%m')
+            except ValueError:
+                continue
+            dir_name = os.path.join(self.month_root, name)
+            if os.path.isdir(dir_name):
+                result.append(dir_name)
+        return result
 
-            mon_name = os.path.join(
-                dir_name,
-                now_month
-            )
-            if not os.path.exists(mon_name):
-                os.mkdir(mon_name)
-            self.baseFilename = os.path.join(
-                mon_name,
-                base_name
-            )
+    def get_rotated_files(self, dir_name: str = None) -> list:
+        """
+        Return the rotated files of this handler in ``dir_name``, or in all
+        ``get_rotated_dirs`` if None, from the oldest to the newest, as
+        ``(filename, compressed)`` tuples.
+        """
+        prefix = os.path.basename(self.baseFilename) + '.'
+        result = []
+        dir_names = self.get_rotated_dirs() if dir_name is None else [dir_name]
+        for dir_name in dir_names:
+            for filename in os.listdir(dir_name):
+                if not filename.startswith(prefix):
+                    continue
+                suffix, compressed = filename[len(prefix):], False
+                for _, ext in COMPRESSORS.values():
+                    if suffix.endswith(ext):
+                        suffix, compressed = suffix[:-len(ext)], True
+                        break
+                try:
+                    time.strptime(suffix, self.suffix)
+                except ValueError:
+                    continue
+                result.append((suffix, os.path.join(dir_name, filename),
+                               compressed))
+        result.sort()
+        return [(filename, compressed) for _, filename, compressed in result]
+
+    def get_expired_files(self, dir_name: str = None) -> list:
+        result = [filename
+                  for filename, _ in self.get_rotated_files(dir_name)]
+        return result[:max(len(result) - self.backupCount, 0)]
+
+    def getFilesToDelete(self):
+        if self.background:
+            return []
+        if self.month_archiving:
+            return self.get_expired_files()
+        return super().getFilesToDelete()
 
     def doRollover(self):
         """
@@ -113,6 +402,103 @@ class TimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
         super().doRollover()
 
 
+class BufferedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """
+    Timed Rotating FileHandler which coalesces records in memory instead of
+    writing and flushing the file once per record.
+
+    The buffer is written out when it holds ``capacity`` characters, every
+    ``flush_interval`` seconds, when a record at or above ``flush_level``
+    arrives, and before every rollover, so records always land in the file
+    of their own interval.
+    """
+
+    def __init__(self,
+                 filename,
+                 when='h',
+                 interval=1,
+                 backupCount=0,
+                 encoding=None,
+                 delay=False,
+                 utc=False,
+                 atTime=None,
+                 month_archiving=False,
+                 compress=None,
+                 background=False,
+                 capacity=65536,
+                 flush_interval=0.2,
+                 flush_level=logging.ERROR):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self._buffer = []
+        self._buffered = 0
+        self._stopped = threading.Event()
+
+        super().__init__(
+            filename,
+            when=when,
+            interval=interval,
+            backupCount=backupCount,
+            encoding=encoding,
+            delay=delay,
+            utc=utc,
+            atTime=atTime,
+            month_archiving=month_archiving,
+            compress=compress,
+            background=background
+        )
+
+        if self.flush_interval and self.flush_interval > 0:
+            threading.Thread(target=self._flush_periodically,
+                             daemon=True).start()
+
+    def _flush_periodically(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            msg = self.format(record) + self.terminator
+            self._buffer.append(msg)
+            self._buffered += len(msg)
+            if (self._buffered >= self.capacity
+                    or record.levelno >= self.flush_level):
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            if self._buffer:
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write(''.join(self._buffer))
+                self._buffer.clear()
+                self._buffered = 0
+            super().flush()
+        finally:
+            self.release()
+
+    def doRollover(self):
+        self.flush()
+        super().doRollover()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self.acquire()
+        try:
+            self.flush()
+            super().close()
+        finally:
+            self.release()
+
+
 class LevelFilter(logging.Filter):
     def __init__(self, less=False, level=logging.WARNING, name=''):
         super().__init__(name)
@@ -123,6 +509,447 @@ class LevelFilter(logging.Filter):
         return self.less == (record.levelno < self.level)
 
 
+def _lookup_logger(loggers: dict, name: str):
+    """Return the value of ``name`` or its nearest parent in ``loggers``."""
+    while name:
+        if name in loggers:
+            return loggers[name]
+        name = name.rpartition('.')[0]
+    return None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Filter which keeps records at or below ``level`` with the probability
+    ``rate``, records above ``level`` always pass.
+
+    ``loggers`` overrides the rate of a logger and its children, e.g.
+    ``{'urllib3': 0.01}``. The decision is stored in the record, so one
+    filter can be shared by several handlers.
+    """
+
+    def __init__(self, rate=1., level=logging.INFO, loggers=None, name=''):
+        super().__init__(name)
+        self.rate = rate
+        self.level = level
+        self.loggers = loggers or {}
+        self._rates = {}
+
+    def get_rate(self, name: str) -> float:
+        rate = self._rates.get(name)
+        if rate is None:
+            rate = _lookup_logger(self.loggers, name)
+            if rate is None:
+                rate = self.rate
+            self._rates[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.level:
+            return True
+        result = getattr(record, '_sampled', None)
+        if result is None:
+            result = random.random() < self.get_rate(record.name)
+            record._sampled = result
+        return result
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Filter which limits the records of every (logger, message template)
+    with a token bucket of ``rate`` records per second and ``burst``
+    records at most.
+
+    ``loggers`` overrides the limits of a logger and its children, e.g.
+    ``{'urllib3': {'rate': 1, 'burst': 5}}``. After records of a template
+    were suppressed, the next record which passes gets the number appended
+    to its message, and in its ``suppressed`` attribute. The decision is
+    stored in the record, so one filter can be shared by several handlers.
+
+    Counts which are not reported that way are summarized every
+    ``interval`` seconds, on the next record of any template, by a
+    ``WARNING`` record ``suppressed N messages: <template>`` of the logger,
+    and by ``flush``.
+    """
+    MAX_BUCKETS = 10000
+
+    def __init__(self, rate=10., burst=20, loggers=None, interval=10.,
+                 name=''):
+        super().__init__(name)
+        self.rate = rate
+        self.burst = burst
+        self.loggers = loggers or {}
+        self.interval = interval
+        self._limits = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._report_at = time.monotonic() + interval
+
+    def get_limit(self, name: str) -> tuple:
+        limit = self._limits.get(name)
+        if limit is None:
+            cfg = _lookup_logger(self.loggers, name) or {}
+            limit = (cfg.get('rate', self.rate), cfg.get('burst', self.burst))
+            self._limits[name] = limit
+        return limit
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        result = getattr(record, '_rate_limited', None)
+        if result is not None:
+            return not result
+
+        msg = record.msg if isinstance(record.msg, str) else str(record.msg)
+        key = (record.name, msg)
+        rate, burst = self.get_limit(record.name)
+        now = time.monotonic()
+        summaries = None
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.MAX_BUCKETS:
+                    summaries = self._pop_counts()
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [burst, now, 0]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                suppressed = -1
+            else:
+                bucket[0] = tokens - 1
+                suppressed, bucket[2] = bucket[2], 0
+            if now >= self._report_at:
+                self._report_at = now + self.interval
+                summaries = (summaries or []) + self._pop_counts()
+
+        record._rate_limited = suppressed < 0
+        if suppressed > 0:
+            record.msg = '%s [suppressed %d messages]' % (
+                record.getMessage(), suppressed)
+            record.args = None
+            record.suppressed = suppressed
+        if summaries:
+            self._report(summaries)
+        return suppressed >= 0
+
+    def flush(self) -> None:
+        """Report the suppressed counts now."""
+        with self._lock:
+            summaries = self._pop_counts()
+            self._report_at = time.monotonic() + self.interval
+        self._report(summaries)
+
+    def _pop_counts(self) -> list:
+        summaries = []
+        for key, bucket in self._buckets.items():
+            if bucket[2]:
+                summaries.append((key, bucket[2]))
+                bucket[2] = 0
+        return summaries
+
+    @staticmethod
+    def _report(summaries: list) -> None:
+        for (name, msg), count in summaries:
+            logger = logging.getLogger(name)
+            record = logger.makeRecord(
+                name, logging.WARNING, '(rate_limit)', 0,
+                'suppressed %d messages: %s', (count, msg), None)
+            record._rate_limited = False
+            record.suppressed = count
+            logger.handle(record)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Handler for sending records to a bounded queue, which is drained by a
+    ``logging.handlers.QueueListener`` on a dedicated writer thread.
+
+    When the queue is full, the ``overflow`` policy decides what happens:
+
+    * ``'block'``: wait until the writer thread makes room.
+    * ``'drop'``: discard the record.
+    * ``'sample'``: keep one record out of every ``sample`` and discard the
+      rest. Records at or above ``ERROR`` always wait for room.
+
+    Discarded records are counted in ``dropped``.
+    """
+    OVERFLOW = ('block', 'drop', 'sample')
+
+    def __init__(self, _queue, overflow='block', sample=10):
+        if overflow not in self.OVERFLOW:
+            raise ValueError('Unknown overflow policy', overflow)
+        super().__init__(_queue)
+        self.overflow = overflow
+        self.sample = max(int(sample), 1)
+        self.dropped = 0
+        self._overflowed = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The record stays in this process, so only merge the arguments to
+        # keep the message stable and leave formatting to the writer thread.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.overflow == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == 'sample':
+                self._overflowed += 1
+                if (record.levelno >= logging.ERROR
+                        or self._overflowed % self.sample == 0):
+                    self.queue.put(record)
+                    return
+            self.dropped += 1
+
+
+COLLECTOR_ENV = 'KITPY_LOG_COLLECTOR'
+COLLECTOR_FAMILY = 'AF_UNIX' if hasattr(socket, 'AF_UNIX') else 'AF_INET'
+
+
+def _record_to_bytes(handler: logging.Handler,
+                     record: logging.LogRecord) -> bytes:
+    # The same fields as ``SocketHandler.makePickle``
+    if record.exc_info:
+        handler.format(record)
+    obj = dict(record.__dict__)
+    obj['msg'] = record.getMessage()
+    obj['args'] = None
+    obj['exc_info'] = None
+    obj.pop('message', None)
+    return pickle.dumps(obj, 1)
+
+
+class CollectorHandler(logging.Handler):
+    """
+    Handler which sends records to the ``LogCollector``.
+
+    It connects lazily with ``multiprocessing.connection.Client``, and
+    authenticates with the collector before sending the first record.
+
+    Args:
+        address (str): the ``COLLECTOR_ENV`` value of the collector
+    """
+
+    def __init__(self, address: str):
+        super().__init__()
+        info = json.loads(address)
+        self.address = info['address']
+        if isinstance(self.address, list):
+            self.address = tuple(self.address)
+        self.authkey = bytes.fromhex(info['authkey'])
+        self.conn: multiprocessing.connection.Connection = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            data = _record_to_bytes(self, record)
+            with self.lock:
+                if self.conn is None:
+                    self.conn = multiprocessing.connection.Client(
+                        self.address, authkey=self.authkey)
+                self.conn.send_bytes(data)
+        except Exception:
+            self.drop()
+            self.handleError(record)
+
+    def drop(self) -> None:
+        """Close the connection, it reconnects on the next record."""
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except OSError:
+                pass
+            self.conn = None
+
+    def close(self) -> None:
+        with self.lock:
+            self.drop()
+        super().close()
+
+
+class _CollectorServer:
+    """Accepts authenticated connections and handles their records."""
+    # a record is never empty
+    WAKE_UP = b''
+
+    def __init__(self, listener: multiprocessing.connection.Listener,
+                 authkey: bytes):
+        self.listener = listener
+        self.authkey = authkey
+        self.stopping = False
+        self.threads = []
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self) -> None:
+        while True:
+            try:
+                conn = self.listener.accept()
+            except (multiprocessing.AuthenticationError, EOFError,
+                    ConnectionError):
+                continue
+            except OSError:
+                return
+            if self.stopping:
+                # Connections accepted before the wake-up one of ``stop``
+                # still have records, the wake-up one sends ``WAKE_UP``.
+                try:
+                    data = conn.recv_bytes()
+                except (EOFError, OSError):
+                    conn.close()
+                    continue
+                if data == self.WAKE_UP:
+                    conn.close()
+                    return
+                self.handle_bytes(data)
+            thread = threading.Thread(target=self.handle, args=(conn,),
+                                      daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    @classmethod
+    def handle(cls, conn: multiprocessing.connection.Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    data = conn.recv_bytes()
+                except (EOFError, OSError):
+                    return
+                cls.handle_bytes(data)
+
+    @staticmethod
+    def handle_bytes(data: bytes) -> None:
+        record = logging.makeLogRecord(pickle.loads(data))
+        logging.getLogger(record.name).handle(record)
+
+    def stop(self, timeout: float) -> None:
+        """
+        Stop accepting, then read every accepted connection to its end.
+        """
+        self.stopping = True
+        # wakes up ``accept``
+        try:
+            with multiprocessing.connection.Client(
+                    self.listener.address, authkey=self.authkey) as conn:
+                conn.send_bytes(self.WAKE_UP)
+        except OSError:
+            pass
+        self.thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0., deadline - time.monotonic()))
+        self.listener.close()
+
+
+def _run_collector(cfg: dict, family: str, host: str, port: int,
+                   authkey: bytes, conn) -> None:
+    cfg = dict(cfg)
+    cfg['console'] = {'enable': False}
+    cfg['multiprocess'] = {'enable': False}
+    log = Log(cfg)
+    log.set_cfg(cfg)
+    log.clear()
+    log.init()
+
+    address = (host, port) if family == 'AF_INET' else None
+    listener = multiprocessing.connection.Listener(address, family,
+                                                   authkey=authkey)
+    if family == 'AF_UNIX':
+        os.chmod(listener.address, 0o600)
+    server = _CollectorServer(listener, authkey)
+    conn.send(listener.address)
+    try:
+        conn.recv()
+    except EOFError:
+        pass
+    server.stop(5.)
+    log.clear()
+    logging.shutdown()
+
+
+class LogCollector:
+    """
+    Process which owns the log files in the multi-process mode.
+
+    Every process logs to the collector through a ``CollectorHandler``,
+    and the collector writes the records with its own rotating file
+    handlers, including the error split of ``LevelFilter``.
+
+    The collector listens on a Unix socket of mode 0600, or on ``host``
+    and ``port`` where Unix sockets are not available. Connections are
+    authenticated with a random ``authkey`` before any record is
+    unpickled, the key is passed to the children by ``COLLECTOR_ENV``.
+
+    The collector stops when ``stop`` is called or the parent process exits,
+    the processes forked from the parent, e.g. the workers of gunicorn,
+    neither stop nor terminate it.
+    """
+
+    def __init__(self, cfg: dict, host='127.0.0.1', port=0, timeout=10.):
+        self.cfg = cfg
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.family = COLLECTOR_FAMILY
+        self.authkey = os.urandom(32)
+        self.pid = os.getpid()
+        self.listen_address = None
+        self._process: multiprocessing.Process = None
+        self._conn = None
+
+    @property
+    def address(self) -> str:
+        """The ``COLLECTOR_ENV`` value, with the address and authkey."""
+        return json.dumps({'address': self.listen_address,
+                           'authkey': self.authkey.hex()})
+
+    def start(self) -> str:
+        """
+        Start the collector process and wait until it listens.
+
+        Returns:
+            str: the ``COLLECTOR_ENV`` value of the collector
+
+        Raises:
+            RuntimeError: the collector did not start within ``timeout``
+        """
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_run_collector,
+            args=(self.cfg, self.family, self.host, self.port, self.authkey,
+                  child_conn),
+            name='LogCollector',
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        if not self._conn.poll(self.timeout):
+            self._process.terminate()
+            raise RuntimeError('log collector did not start')
+        self.listen_address = self._conn.recv()
+        return self.address
+
+    def stop(self) -> None:
+        """
+        Stop the collector after it has read every accepted connection,
+        only the process which started it can.
+        """
+        if self._process is None or self.pid != os.getpid():
+            return
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._process.join(self.timeout)
+        self._conn.close()
+        self._process = None
+
+
 class Log(Singleton):
     LEVEL = {
         'DEBUG': logging.DEBUG,
@@ -143,6 +970,15 @@ class Log(Singleton):
 
         self.root_logger: logging.Logger = self.get_logger()
         self.formatter: logging.Formatter = None
+        self.handlers: list = []
+        self.listener: logging.handlers.QueueListener = None
+        self.collector: LogCollector = None
+
+        atexit.register(self.stop_collector)
+        atexit.register(self.stop_listener)
+        atexit.register(self.flush_filters)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
 
     @classmethod
     def is_status(cls, status: int) -> bool:
@@ -152,9 +988,76 @@ class Log(Singleton):
         self.status = status
 
     def clear(self) -> None:
+        self.flush_filters()
+        self.stop_listener()
+        self.stop_collector()
+        self.close_handlers()
         self.clear_handlers()
         self.status = self.NOT_INIT
 
+    def flush_filters(self) -> None:
+        """Report the counts of the rate limit filters."""
+        filters = {_filter for handler in self.root_logger.handlers
+                   for _filter in handler.filters
+                   if isinstance(_filter, RateLimitFilter)}
+        for _filter in filters:
+            _filter.flush()
+
+    def stop_listener(self) -> None:
+        """
+        Stop the writer thread of the async mode, write out all queued
+        records and close its handlers.
+        """
+        if self.listener is None:
+            return
+        listener, self.listener = self.listener, None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+    def stop_collector(self) -> None:
+        """
+        Close the connections to the collector of the multi-process mode,
+        and stop the collector if this process started it.
+        """
+        for handler in self.handlers:
+            if isinstance(handler, CollectorHandler):
+                handler.close()
+        if self.collector is None or self.collector.pid != os.getpid():
+            return
+        collector, self.collector = self.collector, None
+        os.environ.pop(COLLECTOR_ENV, None)
+        collector.stop()
+
+    def close_handlers(self) -> None:
+        """
+        Close the handlers of ``init``, which writes out their buffers and
+        stops their flush threads.
+        """
+        handlers, self.handlers = self.handlers, []
+        for handler in handlers:
+            handler.close()
+
+    def _after_fork(self) -> None:
+        # The child must not share the sockets of the parent, and the writer
+        # thread of the async mode does not survive a fork. The collector is
+        # no child of a forked process, or multiprocessing would terminate
+        # it when the child exits.
+        if self.collector is not None and self.collector._process is not None:
+            multiprocessing.process._children.discard(
+                self.collector._process)
+        for handler in self.handlers:
+            if isinstance(handler, CollectorHandler):
+                handler.drop()
+        if self.listener is not None:
+            _queue = queue.Queue(self.listener.queue.maxsize)
+            for handler in self.root_logger.handlers:
+                if isinstance(handler, QueueHandler):
+                    handler.queue = _queue
+            self.listener.queue = _queue
+            self.listener._thread = None
+            self.listener.start()
+
     def set_cfg(self, cfg: dict) -> None:
         if not isinstance(cfg, dict):
             cfg = {}
@@ -198,12 +1101,64 @@ class Log(Singleton):
     def _init_logger(self) -> None:
         self.clear()
         self.root_logger.setLevel(self.get_level(self.cfg.level))
-        self.formatter = logging.Formatter(fmt=self.cfg.fmt,
-                                           datefmt=self.cfg.datefmt)
+        self.formatter = self._get_formatter()
+        self.handlers = []
         self._set_console_handler()
         self._set_file_handler()
+        self._mount_handlers()
         self.set_status(self.INITED)
 
+    def _get_formatter(self) -> logging.Formatter:
+        if self.cfg.format == 'json':
+            return JsonFormatter(datefmt=self.cfg.datefmt)
+        return Formatter(fmt=self.cfg.fmt, datefmt=self.cfg.datefmt)
+
+    def _add_handler(self, handler: logging.Handler) -> None:
+        self.handlers.append(handler)
+
+    def _get_filters(self) -> list:
+        filters = []
+        cfg = self.cfg.sampling
+        if cfg and cfg.enable:
+            filters.append(SamplingFilter(
+                rate=cfg.rate if cfg.rate is not None else 1.,
+                level=self.get_level(cfg.level),
+                loggers=cfg.loggers
+            ))
+        cfg = self.cfg.rate_limit
+        if cfg and cfg.enable:
+            filters.append(RateLimitFilter(
+                rate=cfg.rate if cfg.rate is not None else 10.,
+                burst=cfg.burst if cfg.burst is not None else 20,
+                loggers=cfg.loggers,
+                interval=cfg.interval if cfg.interval is not None else 10.
+            ))
+        return filters
+
+    def _mount_handlers(self) -> None:
+        filters = self._get_filters()
+        if not self.cfg.get('async'):
+            for handler in self.handlers:
+                for _filter in filters:
+                    handler.addFilter(_filter)
+                self.root_logger.addHandler(handler)
+            return
+
+        cfg = self.cfg.queue or {}
+        _queue = queue.Queue(cfg.get('size') or 0)
+        queue_handler = QueueHandler(_queue,
+                                     overflow=cfg.get('overflow') or 'block',
+                                     sample=cfg.get('sample') or 1)
+        for _filter in filters:
+            queue_handler.addFilter(_filter)
+        self.listener = logging.handlers.QueueListener(
+            _queue,
+            *self.handlers,
+            respect_handler_level=True
+        )
+        self.listener.start()
+        self.root_logger.addHandler(queue_handler)
+
     def _set_console_handler(self) -> None:
         if self.cfg.console is None or not self.cfg.console.enable:
             return
@@ -211,40 +1166,73 @@ class Log(Singleton):
         console_handler = logging.StreamHandler()
         console_handler.setLevel(self.get_level(self.cfg.console.level))
         console_handler.setFormatter(self.formatter)
-        self.root_logger.addHandler(console_handler)
+        self._add_handler(console_handler)
 
     def _set_file_handler(self) -> None:
         if self.cfg.file is None or not self.cfg.file.enable:
             return
 
+        if self.cfg.multiprocess and self.cfg.multiprocess.enable:
+            self._set_collector_handler()
+            return
+
         basename = self._get_basename()
 
         if self.cfg.file.error_enable:
             rsp_handler = self._get_timed_handler(basename)
             rsp_handler.addFilter(LevelFilter(True))
-            self.root_logger.addHandler(rsp_handler)
+            self._add_handler(rsp_handler)
             err_handler = self._get_timed_handler(basename
                                                   + self.cfg.file.error_suffix)
             err_handler.addFilter(LevelFilter(False))
-            self.root_logger.addHandler(err_handler)
+            self._add_handler(err_handler)
         else:
             handler = self._get_timed_handler(basename)
-            self.root_logger.addHandler(handler)
+            self._add_handler(handler)
+
+    def _set_collector_handler(self) -> None:
+        address = os.environ.get(COLLECTOR_ENV)
+        if not address:
+            self.collector = LogCollector(
+                self.cfg,
+                host=self.cfg.multiprocess.host or '127.0.0.1',
+                port=self.cfg.multiprocess.port or 0
+            )
+            address = self.collector.start()
+            os.environ[COLLECTOR_ENV] = address
+        self._add_handler(CollectorHandler(address))
 
     def _get_basename(self) -> str:
         root = ROOT if ROOT != './' else self.cfg.file.root
         path = os.path.join(root, self.cfg.file.path)
-        if not os.path.exists(path):
-            os.mkdir(path)
+        os.makedirs(path, exist_ok=True)
         return os.path.normpath(os.path.join(path, self.cfg.file.basename))
 
     def _get_timed_handler(self, basename: str) -> TimedRotatingFileHandler:
-        handler = TimedRotatingFileHandler(
-            basename,
-            when=self.cfg.file.when,
-            encoding='utf-8',
-            month_archiving=self.cfg.file.month
-        )
+        if self.cfg.file.buffer_size:
+            handler = BufferedTimedRotatingFileHandler(
+                basename,
+                when=self.cfg.file.when,
+                encoding='utf-8',
+                month_archiving=self.cfg.file.month,
+                backupCount=self.cfg.file.backup_count or 0,
+                compress=self.cfg.file.compress,
+                background=True,
+                capacity=self.cfg.file.buffer_size,
+                flush_interval=self.cfg.file.flush_interval,
+                flush_level=self.get_level(self.cfg.file.flush_level,
+                                           logging.ERROR)
+            )
+        else:
+            handler = TimedRotatingFileHandler(
+                basename,
+                when=self.cfg.file.when,
+                encoding='utf-8',
+                month_archiving=self.cfg.file.month,
+                backupCount=self.cfg.file.backup_count or 0,
+                compress=self.cfg.file.compress,
+                background=True
+            )
         handler.suffix += self.cfg.file.suffix
         handler.setLevel(self.get_level(self.cfg.file.level))
         handler.setFormatter(self.formatter)
@@ -1,7 +1,16 @@
 # -*- coding: utf-8 -*-
 """String File IO"""
+import contextlib
 import os
-from typing import AnyStr, Iterable, Sequence, Union
+import stat
+import uuid
+from typing import IO, AnyStr, Iterable, Iterator, Sequence, Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
 
 from kitpy.path import delete
 
@@ -24,6 +33,128 @@ def write(path: AnyStr,
             f.write(content)
 
 
+@contextlib.contextmanager
+def open_atomic(path: AnyStr,
+                mode='w',
+                encoding='utf-8',
+                fsync=False) -> Iterator[IO]:
+    """
+    Open a file to be replaced atomically.
+
+    The content is written to a temporary file in the same directory, which
+    replaces ``path`` when the block exits without error, so readers see
+    either the old or the new file and a crash never leaves a truncated
+    one. A symlink ``path`` is resolved, so its target is replaced and the
+    link is kept.
+
+    Args:
+        path (AnyStr): the file path
+        mode (str): ``'w'`` for String, ``'wb'`` for bytes
+        encoding (str): the file encoding, default ``'utf-8'``
+        fsync (bool): if True, flush the file and its directory to disk
+            before replacing
+
+    Yields:
+        IO: the temporary file
+    """
+    path = os.path.realpath(path)
+    dir_name, base_name = os.path.split(path)
+    tmp = os.path.join(dir_name, f'.{base_name}.{uuid.uuid4().hex[:8]}.tmp')
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        if 'b' in mode:
+            f = os.fdopen(fd, 'wb')
+        else:
+            f = os.fdopen(fd, 'w', encoding=encoding)
+        with f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp, stat.S_IMODE(os.stat(path).st_mode))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    if fsync and fcntl is not None:
+        dir_fd = os.open(dir_name, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def write_atomic(path: AnyStr,
+                 content: Union[str, bytes],
+                 encoding='utf-8',
+                 fsync=False) -> None:
+    """
+    Write String or bytes to a file atomically, see ``open_atomic``.
+
+    Args:
+        path (AnyStr): the file path
+        content (Union[str, bytes]): the file content
+        encoding (str): the file encoding, default ``'utf-8'``
+        fsync (bool): if True, flush the file and its directory to disk
+            before returning
+    """
+    mode = 'wb' if isinstance(content, bytes) else 'w'
+    with open_atomic(path, mode, encoding, fsync) as f:
+        f.write(content)
+
+
+@contextlib.contextmanager
+def lock(path: AnyStr) -> Iterator[None]:
+    """
+    Hold an exclusive advisory lock for a file.
+
+    The lock is taken on ``path + '.lock'`` of the real ``path``, so
+    ``path`` itself can be replaced while the lock is held, and writers of
+    other files never wait for each other. The lock is not reentrant, a
+    nested ``lock`` of the same file deadlocks.
+
+    On POSIX the lock file is removed on release. A waiter which then
+    holds the ``flock`` of a removed file opens the new one and tries
+    again. Other platforms keep the lock file.
+
+    Args:
+        path (AnyStr): the file path
+    """
+    lock_path = f'{os.path.realpath(path)}.lock'
+    if fcntl is not None:
+        while True:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                current = os.stat(lock_path)
+            except FileNotFoundError:
+                current = None
+            if current is not None and \
+                    os.path.samestat(current, os.fstat(fd)):
+                break
+            os.close(fd)
+        try:
+            yield
+        finally:
+            os.remove(lock_path)
+            os.close(fd)
+        return
+
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+
 def read(path: AnyStr, encoding='utf-8') -> Sequence[str]:
     """
     Read String from a file.
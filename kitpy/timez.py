@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import math
+import re
 import time
 import logging
 
@@ -46,15 +48,87 @@ class TimeFormat:
     NUMONLY_LONG = '%Y%m%d%H%M%S'
 
 
+class TimeCache:
+    """
+    Cache of formatted local time, one entry per format.
+
+    An entry is reused while the timestamp stays in the same second, minute
+    or day, depending on the finest field of the format, e.g.
+    ``TimeFormat.SHORT`` is formatted once per day. Entries are immutable
+    tuples, so the cache is safe to share between threads.
+
+    Call ``clear`` after changing the timezone with ``time.tzset``.
+    """
+    MAX_SIZE = 128
+    SECOND = 0
+    MINUTE = 1
+    DAY = 2
+    DIRECTIVE = re.compile(r'%[-_0^#EO]*(.)')
+    DAY_DIRECTIVES = frozenset('aAbBCdDeFgGhjmnUuVwWxyYt%')
+    MINUTE_DIRECTIVES = frozenset('HIklMpRZz')
+
+    def __init__(self):
+        self._entries = dict()
+        self._resolutions = dict()
+
+    def clear(self) -> None:
+        self._entries = dict()
+        self._resolutions = dict()
+
+    def resolution(self, fmt: str) -> int:
+        """Return the finest field of ``fmt``: SECOND, MINUTE or DAY."""
+        result = self._resolutions.get(fmt)
+        if result is None:
+            result = self.DAY
+            for directive in self.DIRECTIVE.findall(fmt):
+                if directive in self.DAY_DIRECTIVES:
+                    continue
+                if directive not in self.MINUTE_DIRECTIVES:
+                    result = self.SECOND
+                    break
+                result = self.MINUTE
+            self._resolutions[fmt] = result
+        return result
+
+    def strftime(self, fmt: str, timestamp: float) -> str:
+        entry = self._entries.get(fmt)
+        if entry is not None and entry[0] <= timestamp < entry[1]:
+            return entry[2]
+
+        struct_time = time.localtime(timestamp)
+        result = time.strftime(fmt, struct_time)
+        start = math.floor(timestamp)
+        stop = start + 1
+        resolution = self.resolution(fmt)
+        if resolution == self.MINUTE:
+            start -= struct_time.tm_sec
+            stop = start + 60
+        elif resolution == self.DAY:
+            year, month, day = struct_time[:3]
+            start = time.mktime((year, month, day, 0, 0, 0, 0, 0, -1))
+            stop = time.mktime((year, month, day + 1, 0, 0, 0, 0, 0, -1))
+        if not start <= timestamp < stop:
+            start = math.floor(timestamp)
+            stop = start + 1
+
+        if len(self._entries) >= self.MAX_SIZE:
+            self._entries = dict()
+        self._entries[fmt] = (start, stop, result)
+        return result
+
+
+_CACHE = TimeCache()
+
+
 def now(fmt: str = TimeFormat.LONG) -> str:
-    return strftime(fmt)
+    return _CACHE.strftime(fmt, time.time())
 
 
 def strftime(fmt: str = TimeFormat.LONG, struct_time=None, timestamp=None) -> str:
     if struct_time is None:
         if timestamp is None:
             timestamp = time.time()
-        struct_time = time.localtime(timestamp)
+        return _CACHE.strftime(fmt, timestamp)
     return time.strftime(fmt, struct_time)
 
 
@@ -70,5 +144,6 @@ def unix() -> int:
 
 
 # Alias
+clear_cache = _CACHE.clear
 localtime = time.localtime
 sleep = time.sleep
@@ -0,0 +1,85 @@
+import io
+from typing import Union
+
+import pytest
+
+from kitpy.experimental import binary
+from kitpy.experimental import serialize as srl
+
+
+class Blob(srl.Serializable):
+    def __init__(self, name: str, data: bytes) -> None:
+        self.name = name
+        self.data = data
+
+    def __encode__(self) -> Union[dict, list]:
+        return {'name': self.name, 'data': self.data}
+
+    @classmethod
+    def __decode__(cls, obj: Union[dict, list]) -> 'srl.Serializable':
+        return cls(**obj)
+
+
+class TestBinary:
+    def test_scalars(self):
+        for value in [None, True, False, 0, 1, -1, 63, -64, 300, 2 ** 70,
+                      -2 ** 70, 1.5, -0.0, float('inf'), '', 'kitpy 中文',
+                      b'', b'\x00\xff', [], {}]:
+            decoded = binary.decode(binary.encode(value))
+            assert decoded == value and type(decoded) is type(value)
+
+    def test_containers(self):
+        data = {'a': [1, 2.5, (3, b'4')], 1: {'b': None}, b'k': bytearray(b'v')}
+        assert binary.decode(binary.encode(data)) == \
+            {'a': [1, 2.5, [3, b'4']], 1: {'b': None}, b'k': b'v'}
+
+    def test_compact(self):
+        assert binary.encode(1) == b'\x03\x02'
+        assert binary.encode(b'\xff' * 3) == b'\x06\x03\xff\xff\xff'
+        assert len(binary.encode(b'x' * 1000)) < 1005
+
+    def test_serializable(self):
+        data = {'blobs': [Blob('a', b'\x00\x01'), Blob('b', b'')]}
+        encoded = binary.encode(data)
+        decoded = binary.decode(encoded, Blob)
+        assert isinstance(decoded['blobs'][0], Blob)
+        assert decoded['blobs'][0].data == b'\x00\x01'
+        assert binary.decode(encoded)['blobs'][1] == \
+            {'__class__': 'Blob', '__data__': {'name': 'b', 'data': b''}}
+
+    def test_register(self):
+        @srl.register(name='BinaryBlob')
+        class Registered(Blob):
+            ...
+
+        decoded = binary.decode(binary.encode(Registered('a', b'1')))
+        assert isinstance(decoded, Registered)
+
+    def test_dump_load(self):
+        data = [Blob(str(i), bytes(range(i % 256))) for i in range(300)]
+        fp = io.BytesIO()
+        writes = []
+        write = fp.write
+        fp.write = lambda b: writes.append(len(b)) or write(b)
+        binary.dump(data, fp, chunk_size=1024)
+        assert len(writes) > 1
+        fp.seek(0)
+        decoded = binary.load(fp, [Blob])
+        assert [blob.data for blob in decoded] == [blob.data for blob in data]
+
+    def test_encode_into(self):
+        buffer = bytearray(16)
+        size = binary.encode_into([1, 'a'], memoryview(buffer), 2)
+        assert binary.decode(memoryview(buffer)[2:2 + size]) == [1, 'a']
+        with pytest.raises(ValueError):
+            binary.encode_into(b'x' * 32, buffer)
+
+    def test_errors(self):
+        with pytest.raises(TypeError):
+            binary.encode(object())
+        with pytest.raises(ValueError):
+            binary.decode(binary.encode('abc')[:-1])
+        with pytest.raises(ValueError):
+            binary.decode(binary.encode(1) + b'\x00')
+        with pytest.raises(ValueError):
+            binary.decode(b'\xee')
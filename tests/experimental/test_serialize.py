@@ -1,6 +1,9 @@
+import io
 import json
 from typing import Any, Callable, Sequence, Union
 
+import pytest
+
 from kitpy.experimental import serialize as srl
 
 
@@ -101,3 +104,134 @@ class TestSerialize:
         assert 'peoples' in decoded
         for people in decoded['peoples']:
             assert isinstance(people, People)
+
+    def test_encode_compact(self):
+        data = {
+            'peoples': [
+                People('Bob', 18),
+                People('Mike', 19)
+            ]
+        }
+        encoded = srl.encode(data, separators=(',', ':'), ensure_ascii=False)
+        assert encoded == '{"peoples":[' \
+                          '{"__class__":"People","__data__":{"name":"Bob","age":18}},' \
+                          '{"__class__":"People","__data__":{"name":"Mike","age":19}}]}'
+        decoded = srl.decode(encoded, People)
+        assert decoded['peoples'][1].name == 'Mike'
+
+    def test_encode_custom_encoder(self):
+        class Sorted(srl.AdvancedEncoder):
+            def __init__(self, **kwargs):
+                super().__init__(sort_keys=True, **kwargs)
+
+        class Upper(json.JSONEncoder):
+            def encode(self, o):
+                return super().encode(o).upper()
+
+        data = {'b': 1, 'a': People('Bob', 18)}
+        assert srl.encode(data, Sorted) == \
+            '{"a": {"__class__": "People", "__data__": ' \
+            '{"age": 18, "name": "Bob"}}, "b": 1}'
+        assert srl.encode({'a': 'b'}, Upper) == '{"A": "B"}'
+        fp = io.StringIO()
+        srl.encode_stream([{'b': 1, 'a': 2}], fp, cls=Sorted)
+        assert fp.getvalue() == '{"a":2,"b":1}\n'
+
+    def test_register(self):
+        @srl.register(name='RegisteredPeople')
+        class Registered(People):
+            ...
+
+        encoded = srl.encode([Registered('Bob', 18), People('Mike', 19)])
+        assert '"__class__": "RegisteredPeople"' in encoded
+        assert type(Registered('Bob', 18)) in srl._ENCODERS
+        decoded = srl.decode(encoded)
+        assert isinstance(decoded[0], Registered)
+        assert decoded[1] == {'__class__': 'People',
+                              '__data__': {'name': 'Mike', 'age': 19}}
+        assert isinstance(srl.decode(encoded, [Registered])[0], Registered)
+        with pytest.raises(TypeError):
+            srl.register(dict)
+
+    def test_decode_without_class(self):
+        assert srl.decode('{"peoples": [{"name": "Bob"}]}', People) == \
+            {'peoples': [{'name': 'Bob'}]}
+
+    def test_stream_jsonl(self, tmp_path):
+        filename = tmp_path / 'peoples.jsonl'
+        peoples = (People(str(i), i) for i in range(2500))
+        with open(filename, 'w', encoding='utf-8') as fp:
+            assert srl.encode_stream(peoples, fp, batch_size=1000) == 2500
+        with open(filename, encoding='utf-8') as fp:
+            assert fp.readline() == \
+                '{"__class__":"People","__data__":{"name":"0","age":0}}\n'
+        with open(filename, encoding='utf-8') as fp:
+            decoded = srl.decode_stream(fp, People)
+            assert not isinstance(decoded, list)
+            decoded = list(decoded)
+        assert len(decoded) == 2500
+        assert decoded[-1].age == 2499
+        assert isinstance(decoded[0], People)
+
+    def test_stream_binary(self, tmp_path):
+        filename = tmp_path / 'peoples.bin'
+        data = [People('Bob', 18), {'raw': b'\x00'}, People('中文' * 50000, 1)]
+        with open(filename, 'wb') as fp:
+            assert srl.encode_stream(iter(data), fp, fmt='binary') == 3
+        with open(filename, 'rb') as fp:
+            decoded = list(srl.decode_stream(fp, [People], fmt='binary'))
+        assert decoded[0].name == 'Bob'
+        assert decoded[1] == {'raw': b'\x00'}
+        assert decoded[2].name == '中文' * 50000
+        with open(filename, 'rb') as fp:
+            content = fp.read()
+        with pytest.raises(ValueError):
+            list(srl.decode_stream(io.BytesIO(content[:-1]), fmt='binary'))
+        with pytest.raises(ValueError):
+            srl.encode_stream([], io.StringIO(), fmt='xml')
+
+    def test_refs_shared(self):
+        bob = People('Bob', 18)
+        data = {'owner': bob, 'members': [bob, bob, People('Mike', 19)]}
+        encoded = srl.encode(data, refs=True)
+        assert encoded.count('"Bob"') == 1
+        assert encoded.count('{"__ref__": 0}') == 2
+        decoded = srl.decode(encoded, People)
+        assert decoded['owner'] is decoded['members'][0]
+        assert decoded['members'][1] is decoded['members'][0]
+        assert decoded['members'][2].name == 'Mike'
+        assert srl.encode(data, refs=True) == encoded
+
+    def test_refs_cycle(self):
+        class Node(srl.Serializable):
+            def __init__(self, name, children=None):
+                self.name = name
+                self.children = children or []
+
+            def __encode__(self):
+                return {'name': self.name, 'children': self.children}
+
+            @classmethod
+            def __decode__(cls, obj):
+                return cls(**obj)
+
+        root = Node('root')
+        child = Node('child', [root])
+        root.children.append(child)
+        with pytest.raises(ValueError):
+            srl.encode(root)
+        encoded = srl.encode(root, refs=True)
+        decoded = srl.decode(encoded, Node)
+        assert decoded.children[0].name == 'child'
+        assert decoded.children[0].children[0] is decoded
+
+    def test_encode_many(self):
+        peoples = [People(f'name {i}', i) for i in range(100)]
+        serial = srl.encode_many(peoples, separators=(',', ':'))
+        assert serial == [srl.encode(p, separators=(',', ':')) for p in peoples]
+        parallel = srl.encode_many(peoples, workers=2, chunk_size=7,
+                                   threshold=10, separators=(',', ':'))
+        assert parallel == serial
+        decoded = srl.decode_many(parallel, People, workers=2, threshold=10)
+        assert [p.age for p in decoded] == list(range(100))
+        assert isinstance(decoded[0], People)
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from kitpy import jsonz
+
+
+DATA = {'name': 'Bob', 'age': 18, 'tags': ['a', 'b'], 'nested': {'x': None},
+        'text': 'ünïcode/slash'}
+
+
+class TestJsonz:
+    def test_available(self):
+        names = jsonz.available()
+        assert names[-1] == 'json' or 'json' in names
+        assert jsonz.backend().name == names[0]
+
+    @pytest.mark.parametrize('name', jsonz.available())
+    def test_backend(self, name):
+        previous = jsonz.backend()
+        jsonz.use(name)
+        try:
+            for kwargs in ({'separators': jsonz.COMPACT},
+                           {'indent': 2},
+                           {},
+                           {'ensure_ascii': True}):
+                assert jsonz.dumps(DATA, **kwargs) == \
+                    json.dumps(DATA, **{'ensure_ascii': False, **kwargs})
+            assert jsonz.loads(jsonz.dumps(DATA)) == DATA
+            special = {'a': [float('nan'), None],
+                       'b': {'c': float('inf'), 'd': -float('inf')}}
+            for kwargs in ({'separators': jsonz.COMPACT}, {'indent': 2}):
+                assert jsonz.dumps(special, **kwargs) == \
+                    json.dumps(special, **{'ensure_ascii': False, **kwargs})
+            assert jsonz.dumps(2 ** 70, separators=jsonz.COMPACT) == \
+                str(2 ** 70)
+            for value in (2 ** 64, -2 ** 63 - 1, 2 ** 70, 2 ** 63 - 1):
+                assert jsonz.loads(str(value)) == value
+                assert jsonz.loads(f'{{"a": [{value}]}}') == {'a': [value]}
+            assert jsonz.loads('{"a": {"b": 1}}',
+                               object_hook=lambda o: len(o)) == 1
+            assert jsonz.dumps({1: object()}, separators=jsonz.COMPACT,
+                               default=lambda o: 'obj') == '{"1":"obj"}'
+            with pytest.raises(ValueError):
+                jsonz.loads('{')
+        finally:
+            jsonz.use(previous.name)
+
+    def test_use_unknown(self):
+        with pytest.raises(KeyError):
+            jsonz.use('not_exist')
@@ -1,4 +1,13 @@
+import copy
+import json
+import os
+import pickle
+import threading
+
+import pytest
+
 import kitpy as kp
+from kitpy import sio
 
 
 HERE = kp.path.fd(__file__)
@@ -29,6 +38,80 @@ class TestKitpy:
         assert f.get('foo') == 1
         f.set('foo', 2)
         assert f.foo == 2
+        del f.foo
+        assert 'foo' not in f
+        assert f.foo is None
+        f.set('get', 1)
+        f.set('_hidden', 2)
+        try:
+            assert callable(f.get) and f.get('get') == 1
+            assert f.get('_hidden') == 2
+            assert '_hidden' not in vars(f)
+        finally:
+            f.delete('get')
+            f.delete('_hidden')
+
+    def test_flags_define(self):
+        f = kp.FLAGS
+        f.define('test_define.port', 8080)
+        f.define('test_define.debug', type=bool)
+        try:
+            assert f.get('test_define.port') == 8080
+            f.set('test_define.port', '9090')
+            assert f.get('test_define.port') == 9090
+            f.set('test_define.debug', 'false')
+            assert f.get('test_define.debug') is False
+            with pytest.raises(ValueError):
+                f.set('test_define.port', 'abc')
+            assert f.get('test_define.port') == 9090
+            f.define('test_define.port', 1)
+            assert f.get('test_define.port') == 9090
+        finally:
+            f.delete('test_define.port')
+            f.delete('test_define.debug')
+        f.set('test_define.port', 'abc')
+        f.delete('test_define.port')
+
+    def test_flags_subscribe(self):
+        f = kp.FLAGS
+        changes = []
+        callback = f.subscribe(lambda *args: changes.append(args),
+                               'test_subscribe')
+        try:
+            snapshot = f.snapshot()
+            f.test_subscribe = 1
+            f.test_subscribe = 1
+            f.set('test_other', 1)
+            del f.test_subscribe
+            assert changes == [('test_subscribe', None, 1),
+                               ('test_subscribe', 1, None)]
+            assert 'test_subscribe' not in snapshot
+            with pytest.raises(TypeError):
+                f.snapshot()['x'] = 1
+        finally:
+            f.unsubscribe(callback)
+            f.delete('test_other')
+        f.test_subscribe = 2
+        assert len(changes) == 2
+        f.delete('test_subscribe')
+
+    def test_flags_threads(self):
+        f = kp.FLAGS
+
+        def write(index):
+            for i in range(200):
+                f.set(f'test_thread.{index}.{i}', i)
+
+        threads = [threading.Thread(target=write, args=(i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        keys = [key for key in f.snapshot() if key.startswith('test_thread.')]
+        assert len(keys) == 800
+        for key in keys:
+            f.delete(key)
 
     def test_config_json_load(self):
         source = kp.path.join(CONFIG_PATH, 'demo.json')
@@ -62,3 +145,354 @@ class TestKitpy:
         assert obj.li[0] == 'abc'
         assert isinstance(obj.objs[0], kp.convert.AdvancedDict)
         assert obj.objs[0].c == 3
+
+    def test_convert_dict2ad_lazy(self):
+        data = {
+            'a': 1,
+            'obj': {'b': 2},
+            'objs': [{'c': 3}, [{'d': 4}]]
+        }
+        obj = kp.dict2ad(data, lazy=True)
+        assert isinstance(obj, kp.convert.AdvancedDictView)
+        assert obj.a == 1 and obj.missing is None
+        assert obj.obj is obj.obj
+        assert obj.obj.b == 2
+        assert obj.objs[0].c == 3
+        assert obj.objs[-1][0].d == 4
+        assert obj == data and obj.to_dict() is data
+        obj.obj.b = 5
+        obj.objs.append({'e': 6})
+        assert data['obj']['b'] == 5
+        assert data['objs'][2] == {'e': 6}
+        obj.obj = {'f': 7}
+        assert obj.obj.f == 7
+        del obj['a']
+        assert 'a' not in data and len(obj) == 2
+        assert copy.deepcopy(obj) == obj
+        assert copy.deepcopy(obj).to_dict() is not data
+
+    def test_convert_dict2ad_lazy_source(self):
+        data = {'o': {'a': 1}, 'l': [{'b': 1}, 2, 3]}
+        obj = kp.dict2ad(data, lazy=True)
+        assert obj.o.a == 1 and obj.l[0].b == 1
+        data['o'] = {'a': 99}
+        data['l'][0] = {'b': 99}
+        assert obj.o.a == 99
+        assert obj.l[0].b == 99
+        assert obj.l[-3].b == 99
+        with pytest.raises(IndexError):
+            obj.l[-5]
+        with pytest.raises(IndexError):
+            obj.l[3]
+        assert json.loads(json.dumps(obj.to_dict())) == data
+
+    def test_convert_dict2record(self):
+        rows = [{'id': i, 'name': f'n{i}'} for i in range(10)]
+        rows[1]['extra'] = True
+        records = kp.convert.dict2record(rows, sample_size=2)
+        assert type(records[0]) is kp.convert.record_type(rows[:2])
+        assert records[0].name == 'n0' and records[0].extra is None
+        assert records[1].extra is True
+        assert records[3].to_dict() == {'id': 3, 'name': 'n3', 'extra': None}
+        assert not hasattr(records[0], '__dict__')
+        with pytest.raises(AttributeError):
+            records[0].id = 5
+        with pytest.raises(ValueError):
+            kp.convert.dict2record({'id': 1, 'other': 2}, type(records[0]))
+        point = kp.convert.dict2record({'x': 1, 'y': 2}, name='Point')
+        assert point == (1, 2) and type(point).__name__ == 'Point'
+        assert kp.convert.record_type(['x', 'y'], 'Point') is type(point)
+
+    def test_convert_record_pickle(self):
+        record = kp.convert.dict2record({'id': 1, 'name': 'a'}, name='Row')
+        assert pickle.loads(pickle.dumps(record)) == record
+        assert type(pickle.loads(pickle.dumps(record))) is type(record)
+
+        rows = [{'class': 'a', '_id': 1, 'ok': True}]
+        with pytest.raises(ValueError):
+            kp.convert.dict2record(rows)
+        records = kp.convert.dict2record(rows, rename=True)
+        assert records[0].ok is True and records[0]._0 == 'a'
+        assert records[0].to_dict() == rows[0]
+        copied = pickle.loads(pickle.dumps(records[0]))
+        assert type(copied) is type(records[0])
+        assert copied.to_dict() == rows[0]
+
+    def test_convert_path(self):
+        obj = kp.dict2ad({'file': {'path': 'a.log', 'opts': {'a': {'b': 1}}}})
+        get_path = obj.compile_path('file.path')
+        assert get_path(obj) == 'a.log'
+        assert get_path({'file': {}}) is None
+        assert obj.compile_path('file.opts.a.b', 0)(obj) == 1
+        assert obj.compile_path(['x'], 0)(obj) == 0
+        assert obj.get_path('file.opts.a') == {'b': 1}
+        assert obj.get_path('file.path.x', 'default') == 'default'
+        assert kp.convert.get_path({'a': [1]}, ('a', 0)) == 1
+        assert kp.convert.get_path({'a': [1]}, ('a', 5), 'd') == 'd'
+        assert kp.convert.compile_path(('a', 5), 'd')({'a': [1]}) == 'd'
+        obj.set_path('file.new.key', 2)
+        assert obj.file.new.key == 2
+        assert isinstance(obj.file.new, kp.AdvancedDict)
+        obj.set_path(('file', 'path', 'x'), 3)
+        assert obj.file.path == {'x': 3}
+        assert obj.__dict__ is None
+
+    def test_convert_merge(self):
+        obj = kp.dict2ad({'a': {'b': 1, 'c': [1]}, 'd': 1})
+        result = obj.merge({'a': {'c': {'x': 1}, 'e': 2}, 'd': {'f': 3}})
+        assert result is obj
+        assert obj == {'a': {'b': 1, 'c': {'x': 1}, 'e': 2}, 'd': {'f': 3}}
+        assert isinstance(obj.d, kp.AdvancedDict)
+        deep = inner = dict()
+        for _ in range(5000):
+            inner['x'] = inner = dict()
+        assert kp.convert.merge(dict(), deep) == deep
+
+    def test_convert_columns(self):
+        rows = [{'id': i, 'score': i / 2, 'name': f'n{i}'} for i in range(10)]
+        rows[0]['score'] = 0
+        columns = kp.convert.to_columns(rows, use_numpy=False)
+        assert columns['id'].typecode == 'q'
+        assert columns['score'].typecode == 'd'
+        assert columns['name'] == [row['name'] for row in rows]
+        assert kp.convert.from_columns(columns) == rows
+        assert list(kp.convert.select_columns(columns, ['id'])) == ['id']
+
+        mask = kp.convert.where(columns, 'id', '>=', 7)
+        result = kp.convert.filter_rows(columns, mask)
+        assert list(result['id']) == [7, 8, 9]
+        assert result['id'].typecode == 'q'
+        assert result['name'] == ['n7', 'n8', 'n9']
+        result = kp.convert.take_rows(columns, [3, 1])
+        assert kp.convert.from_columns(result) == [rows[3], rows[1]]
+        mask = kp.convert.where(columns, 'name', 'in', {'n1', 'n2'})
+        assert list(kp.convert.filter_rows(columns, mask)['id']) == [1, 2]
+
+        columns = kp.convert.to_columns([{'a': 1}, {'b': 2 ** 70}],
+                                        use_numpy=False)
+        assert columns == {'a': [1, None], 'b': [None, 2 ** 70]}
+
+    def test_config_cache(self, tmp_path):
+        source = str(tmp_path / 'cache.yml')
+        kp.config.dump(source, {'a': {'b': 1}})
+        cache = kp.config.ConfigCache()
+        data1 = kp.config.load(source)
+        entry = cache._entries[kp.path.realpath(source)]
+        data2 = kp.config.load(source)
+        assert data1 == data2 == {'a': {'b': 1}}
+        assert data1 is not data2
+        assert cache._entries[kp.path.realpath(source)] is entry
+        data1['a']['b'] = 2
+        assert kp.config.load(source) == {'a': {'b': 1}}
+        kp.config.dump(source, {'a': {'b': 10}})
+        assert kp.config.load(source) == {'a': {'b': 10}}
+
+        other = str(tmp_path / 'cache.json')
+        kp.config.dump(other, {'a': 1})
+        assert kp.config.load(other) == {'a': 1}
+        assert kp.path.realpath(other) not in cache._entries
+
+        cache.MAX_ENTRIES = 2
+        try:
+            for name in ('c1.yml', 'c2.yml'):
+                kp.config.dump(str(tmp_path / name), {'name': name})
+                kp.config.load(str(tmp_path / name))
+            assert kp.path.realpath(source) not in cache._entries
+            assert len(cache._entries) == 2
+        finally:
+            del cache.MAX_ENTRIES
+
+    def test_config_watch(self, tmp_path):
+        source = str(tmp_path / 'watch.json')
+        kp.config.dump(source, {'version': 1})
+        received = []
+        watcher = kp.config.ConfigWatcher()
+        watcher.subscribe(source, received.append)
+        watcher.check()
+        assert received == []
+        kp.config.dump(source, {'version': 20})
+        watcher.check()
+        assert received == [{'version': 20}]
+        watcher.unsubscribe(source, received.append)
+        kp.config.dump(source, {'version': 300})
+        watcher.check()
+        assert len(received) == 1
+
+    def test_config_yaml_handler(self, tmp_path):
+        source = str(tmp_path / 'handler.yml')
+        data = {'a': 1, 'b': {'c': [1, 2], 'd': 'text'}}
+        handler = kp.config.YamlHandler(source)
+        handler.dump(data)
+        assert handler.load() == data
+        assert kp.config.YamlHandler.yaml('safe') is \
+            kp.config.YamlHandler.yaml('safe')
+        kp.config.YamlHandler.LOADER = 'pyyaml'
+        try:
+            assert handler.load() == data
+        finally:
+            kp.config.YamlHandler.LOADER = 'ruamel'
+
+    def test_config_atomic_dump(self, tmp_path):
+        source = str(tmp_path / 'atomic.json')
+        kp.config.dump(source, {'a': 1})
+        os.chmod(source, 0o640)
+        kp.config.dump(source, {'a': 2})
+        assert kp.config.load(source) == {'a': 2}
+        assert os.stat(source).st_mode & 0o777 == 0o640
+        with pytest.raises(TypeError):
+            kp.config.dump(source, {'a': object()})
+        assert kp.config.load(source) == {'a': 2}
+        assert sorted(kp.path.listdir(str(tmp_path))) == ['atomic.json']
+
+    def test_sio_lock(self, tmp_path):
+        source = str(tmp_path / 'locked.json')
+        events = []
+
+        def hold():
+            with sio.lock(source):
+                events.append('second')
+
+        with sio.lock(source):
+            thread = threading.Thread(target=hold)
+            thread.start()
+            thread.join(0.1)
+            events.append('first')
+        thread.join()
+        assert events == ['first', 'second']
+        assert kp.path.listdir(str(tmp_path)) == []
+
+        other = str(tmp_path / 'other.json')
+        with sio.lock(source):
+            with sio.lock(other):
+                assert sorted(kp.path.listdir(str(tmp_path))) == \
+                    ['locked.json.lock', 'other.json.lock']
+        assert kp.path.listdir(str(tmp_path)) == []
+
+    def test_sio_lock_threads(self, tmp_path):
+        source = str(tmp_path / 'counter')
+        sio.write(source, '0')
+
+        def increase():
+            for _ in range(10):
+                with sio.lock(source):
+                    value = int(sio.read(source)[0])
+                    sio.write_atomic(source, str(value + 1))
+
+        threads = [threading.Thread(target=increase) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sio.read(source) == ['40']
+        assert kp.path.listdir(str(tmp_path)) == ['counter']
+
+    def test_config_dump_symlink(self, tmp_path):
+        real = str(tmp_path / 'real.json')
+        link = str(tmp_path / 'link.json')
+        kp.config.dump(real, {'a': 1})
+        os.symlink(real, link)
+        kp.config.dump(link, {'a': 2})
+        assert os.path.islink(link)
+        assert kp.config.load(real, cache=False) == {'a': 2}
+
+    def test_layered_config_internal_env(self, tmp_path, monkeypatch):
+        source = str(tmp_path / 'internal.json')
+        kp.config.dump(source, {'a': 1})
+        monkeypatch.setenv(kp.log.COLLECTOR_ENV, '{"address": "x"}')
+        monkeypatch.setenv('KITPY_B', '2')
+        cfg = kp.LayeredConfig(source, flags=False)
+        assert sorted(cfg.keys()) == ['a', 'b']
+
+    def test_layered_config(self, tmp_path, monkeypatch):
+        source = str(tmp_path / 'layered.json')
+        kp.config.dump(source, {'logging': {'level': 'warning',
+                                            'file': {'path': 'logs'}}})
+        monkeypatch.setenv('TEST_LAYERED_LOGGING__FILE__ENABLE', 'false')
+        kp.FLAGS.set('logging.console.level', 'error')
+        try:
+            cfg = kp.LayeredConfig(source,
+                                   defaults={'logging': kp.DEFAULT_CFG},
+                                   env_prefix='TEST_LAYERED_')
+        finally:
+            kp.FLAGS.delete('logging.console.level')
+        assert cfg['logging.level'] == 'warning'
+        assert cfg.get('logging.fmt') == kp.DEFAULT_CFG['fmt']
+        assert cfg['logging.file.path'] == 'logs'
+        assert cfg['logging.file.enable'] is False
+        assert cfg['logging.console.level'] == 'error'
+        assert cfg['logging.file']['suffix'] == '.log'
+        assert 'logging.not_exist' not in cfg
+        with pytest.raises(TypeError):
+            cfg['logging']['level'] = 'debug'
+        data = cfg.as_dict()
+        data['logging']['level'] = 'debug'
+        assert cfg['logging.level'] == 'warning'
+
+    def test_config_snapshot(self, tmp_path):
+        source = str(tmp_path / 'snapshot.yml')
+        kp.config.dump(source, {'a': [1, 2], 'b': 'text'})
+        handler = kp.ConfigHandler(source, snapshot=True)
+        assert handler.snapshot_filename == str(tmp_path / '.snapshot.yml.cache')
+        assert handler.load() == {'a': [1, 2], 'b': 'text'}
+        assert kp.path.exists(handler.snapshot_filename)
+
+        calls = []
+        parse = handler._handler.load
+        handler._handler.load = lambda: calls.append(1) or parse()
+        assert handler.load() == {'a': [1, 2], 'b': 'text'}
+        os.utime(source, ns=(0, 0))
+        assert handler.load() == {'a': [1, 2], 'b': 'text'}
+        assert calls == []
+
+        kp.config.dump(source, {'a': [3]})
+        assert handler.load() == {'a': [3]}
+        assert calls == [1]
+        with open(handler.snapshot_filename, encoding='utf-8') as f:
+            assert json.loads(f.readlines()[1]) == {'a': [3]}
+
+        if hasattr(os, 'getuid'):
+            os.chmod(handler.snapshot_filename, 0o666)
+            assert handler.load() == {'a': [3]}
+            assert calls == [1, 1]
+            assert os.stat(handler.snapshot_filename).st_mode & 0o777 == 0o644
+
+        sio.write(source, 'a: 2021-06-01\n')
+        os.remove(handler.snapshot_filename)
+        assert str(handler.load()['a']) == '2021-06-01'
+        assert not kp.path.exists(handler.snapshot_filename)
+
+    def test_config_json_iter_load(self, tmp_path):
+        source = str(tmp_path / 'array.json')
+        data = [{'id': i, 'name': f'item {i}', 'value': i * 1.5}
+                for i in range(100)] + [12345, 'a, b]', [], None]
+        sio.write(source, json.dumps(data, indent=1))
+        handler = kp.JsonHandler(source)
+        assert list(handler.iter_load(chunk_size=7)) == data
+        sio.write(source, ' [ ] ')
+        assert list(handler.iter_load()) == []
+        sio.write(source, '{"a": 1}')
+        assert list(handler.iter_load()) == [{'a': 1}]
+        sio.write(source, '[1, 2')
+        with pytest.raises(json.JSONDecodeError):
+            list(handler.iter_load())
+
+    def test_config_json_iter_load_numbers(self, tmp_path):
+        source = str(tmp_path / 'numbers.json')
+        data = [1.5, 2e10, -3, 0.25, -1.5e-7, 12345678901234567890, 6.02E+23,
+                [1e5, {'a': -0.0}], 7]
+        sio.write(source, '[1.5, 2e10, -3, 0.25, -1.5e-7, '
+                          '12345678901234567890, 6.02E+23, '
+                          '[1e5, {"a": -0.0}], 7]')
+        handler = kp.JsonHandler(source)
+        for chunk_size in range(1, 17):
+            assert list(handler.iter_load(chunk_size=chunk_size)) == data
+
+    def test_config_json_lines(self, tmp_path):
+        source = str(tmp_path / 'records.jsonl')
+        handler = kp.ConfigHandler(source)
+        assert isinstance(handler._handler, kp.JsonLinesHandler)
+        handler.dump({'id': i} for i in range(3))
+        handler.append(({'id': i} for i in range(3, 10)), batch_size=4)
+        assert list(handler.iter_load()) == [{'id': i} for i in range(10)]
+        assert kp.config.load(source, cache=False) == \
+            [{'id': i} for i in range(10)]
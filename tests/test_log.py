@@ -1,4 +1,18 @@
+import gzip
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import subprocess
+import sys
+import time
+
+import pytest
+
 import kitpy as kp
+from kitpy import sio
 
 
 HERE = kp.path.fd(__file__)
@@ -9,6 +23,33 @@ DEFAULT_CFG['file']['basename'] = 'kitpy'
 DEFAULT_CFG['file']['root'] = ROOT
 Log = kp.Log
 log = Log({})
+COLLECTOR_SCRIPT = """
+import multiprocessing
+import os
+import sys
+
+import kitpy as kp
+
+cfg = kp.convert.dict2ad(kp.log.DEFAULT_CFG)
+cfg.console.enable = False
+cfg.file.path = sys.argv[1]
+cfg.file.basename = 'collector'
+cfg.file.month = False
+cfg.multiprocess.enable = True
+if sys.argv[2] != 'fork':
+    multiprocessing.set_start_method(sys.argv[2])
+log = kp.Log(cfg)
+log.set_cfg(cfg)
+log.init()
+if sys.argv[2] == 'fork':
+    pid = os.fork()
+    if pid == 0:
+        kp.Log.get_logger('collector').info('from child')
+        sys.exit(0)
+    os.waitpid(pid, 0)
+kp.Log.get_logger('collector').info('from parent')
+log.clear()
+"""
 
 
 class TestLog:
@@ -59,3 +100,316 @@ class TestLog:
         assert Log.is_status(Log.INITED)
         assert not log.init()
 
+    def test_async_init(self):
+        cfg = kp.convert.dict2ad(DEFAULT_CFG)
+        cfg['async'] = True
+        log.clear()
+        log.set_cfg(cfg)
+        assert log.init()
+        assert Log.is_status(Log.INITED)
+        assert log.listener is not None
+        handlers = Log.get_logger().handlers
+        assert len(handlers) == 1
+        assert isinstance(handlers[0], kp.log.QueueHandler)
+        Log.get_logger('test_async_init').info('OK')
+        log.clear()
+        assert log.listener is None
+
+    def test_queue_handler_drop(self):
+        _queue = queue.Queue(1)
+        handler = kp.log.QueueHandler(_queue, overflow='drop')
+        logger = logging.getLogger('test_queue_handler_drop')
+        logger.propagate = False
+        logger.addHandler(handler)
+        logger.warning('first')
+        logger.warning('second')
+        logger.removeHandler(handler)
+        assert _queue.qsize() == 1
+        assert _queue.get().getMessage() == 'first'
+        assert handler.dropped == 1
+
+    def test_buffered_handler(self, tmp_path):
+        filename = str(tmp_path / 'buffered.log')
+        handler = kp.log.BufferedTimedRotatingFileHandler(
+            filename, when='D', encoding='utf-8', flush_interval=0)
+        logger = logging.getLogger('test_buffered_handler')
+        logger.propagate = False
+        logger.addHandler(handler)
+        logger.warning('buffered')
+        with open(filename, encoding='utf-8') as f:
+            assert f.read() == ''
+        logger.error('flushed')
+        with open(filename, encoding='utf-8') as f:
+            assert f.read() == 'buffered\nflushed\n'
+        logger.warning('closed')
+        logger.removeHandler(handler)
+        handler.close()
+        with open(filename, encoding='utf-8') as f:
+            assert f.read().endswith('closed\n')
+
+    def test_buffered_clear(self):
+        cfg = kp.convert.dict2ad(DEFAULT_CFG)
+        cfg.file.buffer_size = 1024
+        log.clear()
+        log.set_cfg(cfg)
+        assert log.init()
+        handlers = [handler for handler in log.handlers if isinstance(
+            handler, kp.log.BufferedTimedRotatingFileHandler)]
+        assert len(handlers) == 2
+        Log.get_logger('test_buffered_clear').info('buffered')
+        log.clear()
+        assert log.handlers == []
+        for handler in handlers:
+            assert handler._stopped.is_set()
+            assert handler.stream is None
+        with open(handlers[0].baseFilename, encoding='utf-8') as f:
+            assert 'buffered' in f.read()
+
+    def test_month_rollover(self, tmp_path):
+        handler = kp.log.TimedRotatingFileHandler(
+            str(tmp_path / 'month'), when='D', month_archiving=True)
+        now = kp.timez.unix()
+        assert handler.month_rollover_at > now
+        month = kp.timez.strftime('%Y-%m')
+        assert kp.path.isdir(str(tmp_path / month))
+        boundary = handler.compute_month_rollover(
+            time.mktime((2020, 12, 15, 12, 0, 0, 0, 0, -1)))
+        assert kp.timez.strftime('%Y-%m-%d %H:%M:%S', timestamp=boundary) \
+            == '2021-01-01 00:00:00'
+        handler.month_rollover_at = 0
+        handler.update_month_archiving()
+        assert handler.baseFilename == str(tmp_path / month / 'month')
+        assert handler.month_rollover_at > now
+        handler.close()
+
+    def test_multiprocess(self):
+        cfg = kp.convert.dict2ad(DEFAULT_CFG)
+        cfg.file.basename = 'kitpy_multiprocess'
+        cfg.file.month = False
+        cfg.multiprocess.enable = True
+        log.clear()
+        log.set_cfg(cfg)
+        basename = log._get_basename()
+        assert log.init()
+        assert log.collector is not None
+        address = log.collector.address
+        assert os.environ[kp.log.COLLECTOR_ENV] == address
+        info = json.loads(address)
+        if kp.log.COLLECTOR_FAMILY == 'AF_UNIX':
+            assert os.stat(info['address']).st_mode & 0o777 == 0o600
+        with pytest.raises(multiprocessing.AuthenticationError):
+            multiprocessing.connection.Client(info['address'],
+                                              authkey=b'wrong key')
+
+        process = multiprocessing.Process(target=log_in_worker)
+        process.start()
+        process.join()
+        Log.get_logger('test_multiprocess').info('from parent')
+        Log.get_logger('test_multiprocess').error('error from parent')
+        log.clear()
+        assert log.collector is None
+        assert kp.log.COLLECTOR_ENV not in os.environ
+
+        with open(basename, encoding='utf-8') as f:
+            content = f.read()
+        assert 'from worker' in content
+        assert 'from parent' in content
+        with open(basename + cfg.file.error_suffix, encoding='utf-8') as f:
+            content = f.read()
+        assert 'error from parent' in content
+        assert 'from worker' not in content
+        kp.path.delete(basename)
+        kp.path.delete(basename + cfg.file.error_suffix)
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+    def test_collector_fork(self, tmp_path):
+        result = subprocess.run(
+            [sys.executable, '-c', COLLECTOR_SCRIPT, str(tmp_path), 'fork'],
+            cwd=ROOT, capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0
+        assert result.stderr == ''
+        with open(tmp_path / 'collector', encoding='utf-8') as f:
+            content = f.read()
+        assert 'from child' in content
+        assert 'from parent' in content
+
+    def test_collector_stop(self, tmp_path):
+        # the record is sent right before the collector is stopped
+        result = subprocess.run(
+            [sys.executable, '-c', COLLECTOR_SCRIPT, str(tmp_path), 'spawn'],
+            cwd=ROOT, capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0
+        with open(tmp_path / 'collector', encoding='utf-8') as f:
+            assert 'from parent' in f.read()
+
+    def test_rate_limit_init(self):
+        cfg = kp.convert.dict2ad(DEFAULT_CFG)
+        cfg.rate_limit.enable = True
+        cfg.sampling.enable = True
+        log.clear()
+        log.set_cfg(cfg)
+        assert log.init()
+        for handler in Log.get_logger().handlers:
+            assert any(isinstance(f, kp.log.RateLimitFilter)
+                       for f in handler.filters)
+        log.clear()
+
+    def test_compress_rollover(self, tmp_path):
+        filename = str(tmp_path / 'archive')
+        handler = kp.log.TimedRotatingFileHandler(
+            filename, when='D', compress='gzip')
+        handler.emit(logging.makeLogRecord({'msg': 'archived'}))
+        handler.doRollover()
+        handler.close()
+        archives = [name for name in kp.path.listdir(str(tmp_path))
+                    if name.endswith('.gz')]
+        assert len(archives) == 1
+        with gzip.open(str(tmp_path / archives[0]), 'rt') as f:
+            assert f.read() == 'archived\n'
+
+    def test_background_retention(self, tmp_path):
+        filename = str(tmp_path / 'retention')
+        for day in ('2021-06-01', '2021-06-02', '2021-06-03'):
+            sio.write(f'{filename}.{day}', day)
+        sio.write(f'{filename}.other', 'other')
+        handler = kp.log.TimedRotatingFileHandler(
+            filename, when='D', backupCount=2, compress='lzma',
+            background=True)
+        assert handler.getFilesToDelete() == []
+        handler.emit(logging.makeLogRecord({'msg': 'archived'}))
+        handler.doRollover()
+        handler.close()
+        kp.log.Archiver().join()
+        names = sorted(kp.path.listdir(str(tmp_path)))
+        assert len(names) == 4
+        assert names[0] == 'retention'
+        assert names[1] == 'retention.2021-06-03.xz'
+        assert names[2].endswith('.xz')
+        assert names[3] == 'retention.other'
+
+    def test_month_retention(self, tmp_path):
+        for day in ('2021-05-30', '2021-05-31', '2021-06-01'):
+            month = tmp_path / day[:7]
+            month.mkdir(exist_ok=True)
+            sio.write(str(month / f'retention.{day}'), day)
+        handler = kp.log.TimedRotatingFileHandler(
+            str(tmp_path / 'retention'), when='D', backupCount=2,
+            month_archiving=True, compress='gzip', background=True)
+        handler.emit(logging.makeLogRecord({'msg': 'archived'}))
+        handler.doRollover()
+        handler.close()
+        kp.log.Archiver().join()
+        assert not kp.path.exists(str(tmp_path / '2021-05'))
+        assert kp.path.listdir(str(tmp_path / '2021-06')) == \
+            ['retention.2021-06-01.gz']
+        current = kp.path.dir(handler.baseFilename)
+        assert len([name for name in kp.path.listdir(current)
+                    if name.endswith('.gz')]) == 1
+
+
+def log_in_worker():
+    Log.get_logger('test_multiprocess').info('from worker')
+
+
+class TestFormatter:
+    def test_cached_time(self):
+        formatter = kp.log.Formatter(fmt=DEFAULT_CFG['fmt'],
+                                     datefmt=DEFAULT_CFG['datefmt'])
+        expected = logging.Formatter(fmt=DEFAULT_CFG['fmt'],
+                                     datefmt=DEFAULT_CFG['datefmt'])
+        record = logging.makeLogRecord({'msg': 'OK', 'created': 1.5,
+                                        'msecs': 500.})
+        assert formatter.format(record) == expected.format(record)
+        record.created, record.msecs = 1.75, 750.
+        assert formatter.format(record) == expected.format(record)
+        record.created = 2.
+        assert formatter.format(record) == expected.format(record)
+
+    def test_json(self):
+        formatter = kp.log.JsonFormatter(datefmt=DEFAULT_CFG['datefmt'])
+        record = logging.makeLogRecord({
+            'name': 'test_json',
+            'levelname': 'INFO',
+            'msg': 'hello %s',
+            'args': ('world',),
+            'created': 1.5,
+            'msecs': 500.,
+            'user': 'Bob',
+        })
+        data = json.loads(formatter.format(record))
+        assert data['timestamp'].endswith('.500')
+        assert data['level'] == 'INFO'
+        assert data['logger'] == 'test_json'
+        assert data['message'] == 'hello world'
+        assert data['user'] == 'Bob'
+        assert 'exc_info' not in data
+
+
+class TestFilter:
+    def make_record(self, name='test_filter', level=logging.INFO,
+                    msg='message %d', args=(1,)):
+        return logging.makeLogRecord({
+            'name': name, 'levelno': level, 'msg': msg, 'args': args})
+
+    def test_rate_limit(self):
+        _filter = kp.log.RateLimitFilter(rate=0.001, burst=2,
+                                         loggers={'quiet': {'burst': 1}})
+        results = [_filter.filter(self.make_record()) for _ in range(5)]
+        assert results == [True, True, False, False, False]
+        assert _filter.filter(self.make_record(msg='other'))
+        assert _filter.filter(self.make_record(name='quiet.child'))
+        assert not _filter.filter(self.make_record(name='quiet.child'))
+
+        record = self.make_record()
+        assert not _filter.filter(record)
+        assert not _filter.filter(record)
+
+        _filter.rate = 1000.
+        _filter._limits.clear()
+        record = self.make_record()
+        kp.timez.sleep(0.01)
+        assert _filter.filter(record)
+        assert record.suppressed == 4
+        assert record.getMessage() == 'message 1 [suppressed 4 messages]'
+
+    def test_rate_limit_summary(self):
+        records = []
+        logger = logging.getLogger('test_rate_limit_summary')
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger.addHandler(handler)
+        logger.propagate = False
+        _filter = kp.log.RateLimitFilter(rate=0.001, burst=1, interval=0.)
+        try:
+            name = 'test_rate_limit_summary'
+            assert _filter.filter(self.make_record(name=name))
+            for _ in range(3):
+                _filter.filter(self.make_record(name=name))
+            assert [r.getMessage() for r in records] == \
+                ['suppressed 1 messages: message %d'] * 3
+            assert _filter.filter(self.make_record(name=name, msg='other'))
+            assert len(records) == 3
+
+            _filter.interval = 3600.
+            _filter.flush()
+            for _ in range(2):
+                _filter.filter(self.make_record(name=name))
+            assert len(records) == 3
+            _filter.MAX_BUCKETS = 2
+            _filter.filter(self.make_record(name=name, msg='third'))
+            assert records[-1].suppressed == 2
+            _filter.filter(self.make_record(name=name, msg='third'))
+            _filter.flush()
+            assert records[-1].getMessage() == \
+                'suppressed 1 messages: third'
+            _filter.flush()
+            assert len(records) == 5
+        finally:
+            logger.removeHandler(handler)
+            logger.propagate = True
+
+    def test_sampling(self):
+        _filter = kp.log.SamplingFilter(rate=0., loggers={'kept': 1.})
+        assert not _filter.filter(self.make_record())
+        assert _filter.filter(self.make_record(name='kept.child'))
+        assert _filter.filter(self.make_record(level=logging.ERROR))
@@ -0,0 +1,32 @@
+import time
+
+import kitpy as kp
+
+
+TimeCache = kp.timez.TimeCache
+
+
+class TestTimez:
+    def test_resolution(self):
+        cache = TimeCache()
+        assert cache.resolution(kp.TimeFormat.SHORT) == TimeCache.DAY
+        assert cache.resolution(kp.TimeFormat.NUMONLY_SHORT) == TimeCache.DAY
+        assert cache.resolution('%Y-%m-%d %H:%M') == TimeCache.MINUTE
+        assert cache.resolution(kp.TimeFormat.LONG) == TimeCache.SECOND
+        assert cache.resolution('%%S') == TimeCache.DAY
+
+    def test_cached_strftime(self):
+        cache = TimeCache()
+        start = time.mktime((2020, 12, 31, 23, 58, 0, 0, 0, -1))
+        for fmt in (kp.TimeFormat.SHORT, '%Y-%m-%d %H:%M',
+                    kp.TimeFormat.GENERAL_LONG):
+            for offset in range(0, 240, 7):
+                timestamp = start + offset + 0.5
+                assert cache.strftime(fmt, timestamp) == \
+                    time.strftime(fmt, time.localtime(timestamp))
+
+    def test_now(self):
+        timestamp = time.time()
+        assert kp.strftime(timestamp=timestamp) == \
+            time.strftime(kp.TimeFormat.LONG, time.localtime(timestamp))
+        assert kp.now(kp.TimeFormat.SHORT) == time.strftime('%Y-%m-%d')